@@ -0,0 +1,61 @@
+# coding: utf-8
+
+# Time of text normalization and english word splitting on inputs of 1k~10k tokens,
+# the time per token should stay flat if the processing is linear.
+#
+# usage: python benchmarks/bench_scaling.py [RESDIR]
+
+import sys
+import time
+import random
+
+from textparser.modules import TextNormalizer, Segmenter
+
+
+def make_text(pieces, ntoken, seed=0):
+    rng = random.Random(seed)
+    return "".join(rng.choice(pieces) for _ in range(ntoken))
+
+
+def timeit(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func(*args)
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    res_root_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    sizes = (1000, 2000, 5000, 10000)
+
+    textnorm = TextNormalizer(res_root_dir)
+    segmenter = Segmenter(res_root_dir)
+
+    # numbers, symbols and words, each piece is about one token after tokenization
+    cn_pieces = ["12", "，", "3.5", "、", "中文", "：", "2023", "%", "。", "年", "(", ")", "-", "abc", " "]
+    en_pieces = ["12 ", ", ", "3.5 ", "words ", "2023 ", "% ", ". ", "it's ", "(", ") ", "- ", "Tom's ", "e.g. "]
+
+    cases = [
+        ("TextNormalizerCN.process", lambda n: textnorm.textnorm_cn.tokenize(make_text(cn_pieces, n)),
+            lambda tokens: textnorm.textnorm_cn.process(tokens)),
+        ("TextNormalizerEN.process", lambda n: textnorm.textnorm_en.tokenize(make_text(en_pieces, n)),
+            lambda tokens: textnorm.textnorm_en.process(tokens)),
+        ("SegmenterEN._split_word", lambda n: make_text(["don't ", "'hello ", "rock'n'roll ", "word ", "(abc) "], n),
+            lambda text: segmenter.segmenter_en._split_word(text)),
+    ]
+
+    for name, make, func in cases:
+        print(name)
+        for n in sizes:
+            data = make(n)
+            ntoken = len(data) if isinstance(data, list) else len(data.split())
+            t = timeit(func, data)
+            print(f"    tokens={ntoken:6d}  time={t*1000:9.2f}ms  per token={t/ntoken*1e6:7.2f}us")
+
+
+if __name__ == "__main__":
+
+    main()
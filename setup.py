@@ -21,7 +21,9 @@ requirements = {
         "numba",
     ],
     "setup": [],
-    "test": []
+    "test": [
+        "pytest",
+    ]
 }
 entry_points = {
     "console_scripts": [
@@ -30,6 +32,7 @@ entry_points = {
         "text-segmenter=textparser.modules.segmenter:main",
         "text-pronunciation=textparser.modules.pronunciation:main",
         "text-vectorization=textparser.modules.vectorization:main",
+        "text-parser-compile=textparser.bundle:main",
     ]
 }
 
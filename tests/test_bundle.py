@@ -0,0 +1,104 @@
+# coding: utf-8
+
+import os
+
+import pytest
+
+from textparser import bundle
+
+
+class _Module(object):
+    # small stand-in of the parsed modules, the bundle only pickles them
+    def __init__(self, res_root_dir=None, loglv=0, use_lexicon=True):
+        self.res_root_dir = res_root_dir
+        self.loglv = loglv
+        self.table = {"res": res_root_dir}
+
+    def compile_lexicon(self, lexicon_path=None):
+        return lexicon_path
+
+    def __call__(self, *args):
+        return args
+
+
+class _Segmenter(_Module):
+    def __init__(self, res_root_dir=None, loglv=0, use_lexicon=True):
+        super().__init__(res_root_dir, loglv, use_lexicon)
+        self.segmenter_cn = _Module(res_root_dir, loglv)
+        self.segmenter_en = _Module(res_root_dir, loglv)
+
+
+@pytest.fixture
+def res_root_dir(tmp_path, monkeypatch):
+    (tmp_path / "resources").mkdir()
+    sources = []
+    for name in ("a.dict", "b.pos"):
+        path = tmp_path / "resources" / name
+        path.write_text(f"{name}\n", encoding="utf-8")
+        sources.append(str(path))
+    monkeypatch.setattr(bundle, "TextNormalizer", _Module)
+    monkeypatch.setattr(bundle, "Segmenter", _Segmenter)
+    monkeypatch.setattr(bundle, "Pronunciation", _Module)
+    monkeypatch.setattr(bundle, "_source_paths", lambda res_root_dir: list(sources))
+    return str(tmp_path)
+
+
+def test_round_trip(res_root_dir):
+    path = bundle.compile_bundle(res_root_dir)
+    assert os.path.exists(path)
+    modules = bundle.load_bundle(res_root_dir, loglv=1)
+    assert modules is not None
+    textnorm, segmeter, pronuciation = modules
+    assert isinstance(segmeter, _Segmenter)
+    assert textnorm.table == {"res": res_root_dir}
+    assert segmeter.loglv == 1 and segmeter.segmenter_cn.loglv == 1
+
+
+def test_missing(res_root_dir):
+    assert bundle.load_bundle(res_root_dir) is None
+
+
+def test_touched_source_is_valid(res_root_dir):
+    bundle.compile_bundle(res_root_dir)
+    os.utime(os.path.join(res_root_dir, "resources", "a.dict"), (0, 0))
+    assert bundle.load_bundle(res_root_dir) is not None
+
+
+def test_modified_source_is_stale(res_root_dir):
+    bundle.compile_bundle(res_root_dir)
+    with open(os.path.join(res_root_dir, "resources", "a.dict"), "at", encoding="utf-8") as f:
+        f.write("new word\n")
+    assert bundle.load_bundle(res_root_dir) is None
+
+
+def test_changed_sources_are_stale(res_root_dir, monkeypatch):
+    bundle.compile_bundle(res_root_dir)
+    monkeypatch.setattr(bundle, "_source_paths", lambda res_root_dir: [])
+    assert bundle.load_bundle(res_root_dir) is None
+
+
+def test_changed_code_is_stale(res_root_dir, monkeypatch):
+    bundle.compile_bundle(res_root_dir)
+    monkeypatch.setattr(bundle, "_code_hash", lambda: "0" * 40)
+    assert bundle.load_bundle(res_root_dir) is None
+
+
+def test_other_version_is_stale(res_root_dir, monkeypatch):
+    bundle.compile_bundle(res_root_dir)
+    monkeypatch.setattr(bundle, "BUNDLE_VERSION", bundle.BUNDLE_VERSION + 1)
+    assert bundle.load_bundle(res_root_dir) is None
+
+
+def test_moved_bundle_is_stale(res_root_dir, tmp_path_factory):
+    path = bundle.compile_bundle(res_root_dir)
+    other = tmp_path_factory.mktemp("other")
+    (other / "resources").mkdir()
+    os.replace(path, bundle._bundle_path(str(other)))
+    assert bundle.load_bundle(str(other)) is None
+
+
+def test_bad_magic(res_root_dir):
+    path = bundle.compile_bundle(res_root_dir)
+    with open(path, "r+b") as f:
+        f.write(b"XXXXXXXX")
+    assert bundle.load_bundle(res_root_dir) is None
@@ -0,0 +1,65 @@
+# coding: utf-8
+
+import random
+
+import pytest
+
+from textparser.utils import DATrie
+
+
+def _prefixes(wordict, text, start=0, maxlen=None):
+    # prefixes by slicing every candidate, which is what the trie replaces
+    end = len(text) if maxlen is None else min(len(text), start + maxlen)
+    return [(j, wordict[text[start:j]]) for j in range(start + 1, end + 1) if text[start:j] in wordict]
+
+
+def _random_words(rng, n, chars="中文分词的字典树测试abc"):
+    return {"".join(rng.choice(chars) for _ in range(rng.randint(1, 6))): i for i in range(n)}
+
+
+def test_empty():
+    trie = DATrie({})
+    assert len(trie) == 0
+    assert trie.prefixes("中文") == []
+    assert "中" not in trie
+    assert trie.get("中") is None
+    with pytest.raises(KeyError):
+        trie["中"]
+
+
+def test_empty_keys_are_ignored():
+    trie = DATrie({"": 0, "a": 1})
+    assert len(trie) == 1
+    assert "" not in trie
+    assert trie.prefixes("ab") == [(1, 1)]
+
+
+def test_lookup():
+    wordict = {"中": 1, "中文": 2, "中文分词": 3, "文": 4}
+    trie = DATrie(wordict)
+    assert len(trie) == len(wordict)
+    for word, value in wordict.items():
+        assert word in trie
+        assert trie[word] == value
+    assert "中文分" not in trie
+    assert trie.get("中文分", -1) == -1
+    assert "英" not in trie
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_prefixes_match_dict(seed):
+    rng = random.Random(seed)
+    wordict = _random_words(rng, 500)
+    trie = DATrie(wordict)
+    for word, value in wordict.items():
+        assert trie[word] == value
+    for _ in range(300):
+        text = "".join(rng.choice("中文分词的字典树测试abcxyz") for _ in range(rng.randint(0, 12)))
+        start = rng.randint(0, len(text))
+        maxlen = rng.choice([None, 1, 3, 13])
+        assert trie.prefixes(text, start, maxlen) == _prefixes(wordict, text, start, maxlen)
+
+
+def test_build_from_items():
+    trie = DATrie([("b", 2), ("a", 1), ("ab", 3)])
+    assert trie.prefixes("abc") == [(1, 1), (2, 3)]
@@ -0,0 +1,102 @@
+# coding: utf-8
+
+import os
+import pickle
+
+import pytest
+
+from textparser.utils import DATrie, Lexicon, LexiconDict, save_lexicon
+
+
+CN_WORDS = {
+    "中": (9.5, ("zhong1",), {"f": 0.5, "n": 1.2}, None),
+    "中文": (5.25, ("zhong1", "wen2"), {"n": 0.0}, {"P": 0.01}),
+    "文": (8.0, None, {"w": 0}, None),
+    "分词": (6.5, ("fen1", "ci2"), {"v": 0.3, "n": 2.0}, {"P": 0.5, "Q": 1.5}),
+}
+
+EN_WORDS = {
+    "HELLO": (["(hh_ax)0", "(l_ow)1"], {"uh": 0.1, "nn": 2.0}),
+    "WORLD": (["(w_er_l_d)1"], {"nn": 0.0}),
+    "HE": (None, {"prp": 0.0}),
+}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "cn.dict.v1"
+    path.write_text("中 zhong1;9.5;f=.5,n=1.2\n", encoding="utf-8")
+    return str(path)
+
+
+def test_cn_round_trip(tmp_path, source):
+    path = save_lexicon(str(tmp_path / "cn.lexicon"), "cn", CN_WORDS, sources=[source])
+    lexicon = Lexicon(path)
+    assert lexicon.kind == "cn"
+    assert len(lexicon) == len(CN_WORDS)
+    assert lexicon.max_word_length == 2
+    for word, info in CN_WORDS.items():
+        assert lexicon[word] == info
+    assert lexicon.get("英") is None
+    assert lexicon.covers(source)
+    assert lexicon.is_valid()
+
+
+def test_en_round_trip(tmp_path):
+    lexicon = Lexicon(save_lexicon(str(tmp_path / "en.lexicon"), "en", EN_WORDS))
+    assert lexicon.kind == "en"
+    for word, info in EN_WORDS.items():
+        assert lexicon[word] == info
+
+
+def test_empty(tmp_path):
+    lexicon = Lexicon(save_lexicon(str(tmp_path / "empty.lexicon"), "cn", {}))
+    assert len(lexicon) == 0
+    assert lexicon.prefixes("中文") == []
+    assert lexicon.get("中") is None
+
+
+def test_prefixes_match_trie(tmp_path):
+    lexicon = Lexicon(save_lexicon(str(tmp_path / "cn.lexicon"), "cn", CN_WORDS))
+    trie = DATrie(CN_WORDS)
+    for text in ("中文分词", "文中", "分词中文", "英文", ""):
+        for start in range(len(text) + 1):
+            assert lexicon.prefixes(text, start) == trie.prefixes(text, start)
+
+
+def test_modified_source_is_invalid(tmp_path, source):
+    lexicon = Lexicon(save_lexicon(str(tmp_path / "cn.lexicon"), "cn", CN_WORDS, sources=[source]))
+    # the same content with a new mtime is still valid
+    os.utime(source, (0, 0))
+    assert lexicon.is_valid()
+    with open(source, "at", encoding="utf-8") as f:
+        f.write("文 wen2;8.0;w=0\n")
+    assert not lexicon.is_valid()
+
+
+def test_not_a_lexicon(tmp_path):
+    path = tmp_path / "bad.lexicon"
+    path.write_bytes(b"not a lexicon file")
+    with pytest.raises(ValueError):
+        Lexicon(str(path))
+
+
+def test_pickle_reopens(tmp_path):
+    lexicon = Lexicon(save_lexicon(str(tmp_path / "cn.lexicon"), "cn", CN_WORDS))
+    lexicon = pickle.loads(pickle.dumps(lexicon))
+    assert lexicon["分词"] == CN_WORDS["分词"]
+
+
+def test_overlay(tmp_path):
+    wordict = LexiconDict(Lexicon(save_lexicon(str(tmp_path / "cn.lexicon"), "cn", CN_WORDS)))
+    user = {"中文": (1.0, ("zhong4", "wen2"), {"n": 0.0}, None), "词典": (2.0, ("ci2", "dian3"), {"n": 0.0}, None)}
+    wordict.update(user)
+    assert len(wordict) == len(CN_WORDS) + 1
+    assert wordict["中文"] == user["中文"]
+    assert wordict.get("中") == CN_WORDS["中"]
+    assert "词典" in wordict
+    merged = dict(CN_WORDS, **user)
+    trie = DATrie(merged)
+    for text in ("中文分词", "词典中文", "分词典"):
+        for start in range(len(text) + 1):
+            assert wordict.prefixes(text, start) == trie.prefixes(text, start)
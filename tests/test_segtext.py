@@ -0,0 +1,44 @@
+# coding: utf-8
+
+import io
+import sys
+import struct
+import marshal
+
+from textparser.utils import SegText, ColumnSegText, dump_segtext, load_segtexts
+
+
+LINE = "无力感/wu2-li4-gan3;n;CN;0;; ，/sil0;w;CN;0;; hello/(hh_ax)0-(l_ow)1;uh;EN;2;P0=a1,; x/;zz;;;;"
+
+
+def test_text_round_trip():
+    assert ColumnSegText(LINE).printer() == LINE
+    assert SegText(LINE).printer() == LINE
+    assert ColumnSegText.from_segtext(SegText(LINE)).printer() == LINE
+    assert ColumnSegText(LINE).to_segtext().printer() == LINE
+
+
+def test_binary_round_trip():
+    segtext = ColumnSegText(LINE)
+    loaded = ColumnSegText.loads(segtext.dumps())
+    assert loaded.printer() == LINE
+    for i in range(len(segtext)):
+        assert list(loaded[i]) == list(segtext[i])
+    assert ColumnSegText.loads(ColumnSegText().dumps()).printer() == ""
+
+
+def test_binary_sentype_is_little_endian():
+    segtext = ColumnSegText(LINE)
+    sentype = marshal.loads(segtext.dumps())[4]
+    assert sentype == struct.pack("<4h", 0, 0, 2, -32768)
+
+
+def test_stream():
+    items = [("u1", ColumnSegText(LINE)), ("u2", SegText(LINE)), ("u3", ColumnSegText())]
+    fid = io.BytesIO()
+    for utt_id, segtext in items:
+        dump_segtext(fid, utt_id, segtext)
+    fid.seek(0)
+    loaded = list(load_segtexts(fid))
+    assert [utt_id for utt_id, _ in loaded] == ["u1", "u2", "u3"]
+    assert [segtext.printer() for _, segtext in loaded] == [LINE, LINE, ""]
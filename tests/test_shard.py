@@ -0,0 +1,68 @@
+# coding: utf-8
+
+import pickle
+
+import numpy as np
+import pytest
+
+from textparser.utils.shard import ShardWriter, ShardReader
+
+
+def _arrays(n, dim=8):
+    rng = np.random.RandomState(0)
+    return {f"utt{i:03d}": rng.randint(0, 255, size=(rng.randint(0, 20), dim)).astype(np.uint8) for i in range(n)}
+
+
+def test_round_trip(tmp_path):
+    arrays = _arrays(50)
+    with ShardWriter(str(tmp_path), shard_size=256) as writer:
+        for utt_id, array in arrays.items():
+            writer.write(utt_id, array)
+    assert writer.shard_id > 0 # several shards
+
+    reader = ShardReader(str(tmp_path))
+    assert len(reader) == len(arrays)
+    assert list(reader.keys()) == list(arrays)
+    for utt_id, array in arrays.items():
+        assert utt_id in reader
+        np.testing.assert_array_equal(reader[utt_id], array)
+    assert reader.get("missing") is None
+
+
+def test_append_to_existing_shards(tmp_path):
+    arrays = _arrays(10)
+    items = list(arrays.items())
+    with ShardWriter(str(tmp_path)) as writer:
+        for utt_id, array in items[:5]:
+            writer.write(utt_id, array)
+    with ShardWriter(str(tmp_path)) as writer:
+        for utt_id, array in items[5:]:
+            writer.write(utt_id, array)
+        assert writer.shard_id == 1
+
+    reader = ShardReader(str(tmp_path))
+    for utt_id, array in items:
+        np.testing.assert_array_equal(reader[utt_id], array)
+
+
+def test_dtype_and_dim_are_fixed(tmp_path):
+    with ShardWriter(str(tmp_path)) as writer:
+        writer.write("a", np.zeros((2, 8), dtype=np.uint8))
+        with pytest.raises(AssertionError):
+            writer.write("b", np.zeros((2, 8), dtype=np.int8))
+        with pytest.raises(AssertionError):
+            writer.write("c", np.zeros((2, 4), dtype=np.uint8))
+        with pytest.raises(AssertionError):
+            writer.write("d e", np.zeros((2, 8), dtype=np.uint8))
+
+
+def test_pickle_reader(tmp_path):
+    arrays = _arrays(5)
+    with ShardWriter(str(tmp_path)) as writer:
+        for utt_id, array in arrays.items():
+            writer.write(utt_id, array)
+    reader = ShardReader(str(tmp_path))
+    reader["utt000"] # open the memory map before pickling
+    reader = pickle.loads(pickle.dumps(reader))
+    for utt_id, array in reader.items():
+        np.testing.assert_array_equal(array, arrays[utt_id])
@@ -0,0 +1,219 @@
+# coding: utf-8
+
+import os, sys
+import json
+import struct
+import pickle
+import hashlib
+
+import textparser
+from textparser import Config
+from textparser.modules import TextNormalizer, Segmenter, Pronunciation
+from textparser.utils import file_stamp, check_stamp, file_sha1
+from textparser.version import __version__
+
+
+BUNDLE_MAGIC = b"TPBUNDLE"
+BUNDLE_VERSION = 2
+
+
+def _bundle_path(res_root_dir):
+    return os.path.join(res_root_dir, Config.bundle_path)
+
+
+def _source_paths(res_root_dir):
+    # all source files that the compiled modules are parsed from
+    paths = []
+    paths += [os.path.join(res_root_dir, path) for path in Config.cn_special_symbols_paths]
+    paths += [os.path.join(res_root_dir, path) for path in Config.en_special_symbols_paths]
+    paths += [os.path.join(res_root_dir, Config.cn_t2s_path)]
+    paths += [os.path.join(res_root_dir, path) for path in Config.cn_dict_paths]
+    paths += [os.path.join(res_root_dir, path) for path in Config.en_dict_paths]
+    paths += [os.path.join(res_root_dir, Config.cn_pos_path)]
+    paths += [os.path.join(res_root_dir, Config.en_pos_path)]
+    paths += [os.path.join(res_root_dir, Config.en_guesspos_path)]
+    paths += [os.path.join(res_root_dir, path) for path in Config.polyphone_paths]
+    paths += [os.path.join(os.path.dirname(textparser.third_part.g2p_en.__file__), "checkpoint20.npz")]
+    # the compiled lexicons are referred by path in the bundle
+    for path in (Config.cn_lexicon_path, Config.en_lexicon_path):
+        path = os.path.join(res_root_dir, path)
+        if os.path.exists(path): paths.append(path)
+    return [os.path.abspath(path) for path in paths]
+
+
+def _code_hash():
+    # hash of all python sources of the package, the pickled objects are only valid with the same code
+    root = textparser.__path__[0]
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted([d for d in dirnames if d != "__pycache__"])
+        paths += [os.path.join(dirpath, f) for f in filenames if f.endswith(".py")]
+    sha1 = hashlib.sha1()
+    for path in sorted(paths):
+        sha1.update(os.path.relpath(path, root).encode("utf-8"))
+        sha1.update(file_sha1(path).encode("ascii"))
+    return sha1.hexdigest()
+
+
+def _set_loglv(obj, loglv, visited=None):
+    # the modules are compiled silently, reset log level of them and their members
+    if visited is None: visited = set()
+    if id(obj) in visited or not hasattr(obj, "__dict__"): return
+    visited.add(id(obj))
+    if hasattr(obj, "loglv"): obj.loglv = loglv
+    for member in vars(obj).values():
+        if hasattr(member, "loglv"):
+            _set_loglv(member, loglv, visited)
+
+
+def compile_bundle(res_root_dir=None, loglv=0):
+    if res_root_dir is None: res_root_dir = textparser.__path__[0]
+    res_root_dir = os.path.abspath(res_root_dir)
+    bundle_path = _bundle_path(res_root_dir)
+
+    func_name = f"{sys._getframe().f_code.co_name}"
+    if loglv > 0:
+        sys.stderr.write(f"{func_name}: compile resources in {res_root_dir}\n")
+
+    # compile lexicons first, then the segmenter in the bundle opens them
+    segmeter = Segmenter(res_root_dir, loglv=loglv, use_lexicon=False)
+    for path in (segmeter.segmenter_cn.compile_lexicon(), segmeter.segmenter_en.compile_lexicon()):
+        if loglv > 0: sys.stderr.write(f"{func_name}: save lexicon to {path}\n")
+    del segmeter
+
+    # parse all resources
+    modules = {
+        "textnorm": TextNormalizer(res_root_dir, loglv=loglv),
+        "segmeter": Segmenter(res_root_dir, loglv=loglv),
+        "pronuciation": Pronunciation(res_root_dir, loglv=loglv),
+    }
+    for module in modules.values():
+        _set_loglv(module, 0)
+
+    # compile the numba kernels once, so that their on-disk cache is ready together with the bundle
+    if Config.use_numba:
+        modules["segmeter"]("warmup", "预热 warm up")
+
+    # header: versions and stat of source files
+    sources = {path: file_stamp(path) for path in _source_paths(res_root_dir)}
+    header = {
+        "bundle_version": BUNDLE_VERSION,
+        "version": __version__,
+        "python": list(sys.version_info[:2]),
+        "code": _code_hash(),
+        "res_root_dir": res_root_dir,
+        "sources": sources,
+    }
+    header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    payload = pickle.dumps(modules, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # format: magic, header length, header, payload
+    tmp_path = bundle_path + f".{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, bundle_path)
+
+    if loglv > 0:
+        sys.stderr.write(f"{func_name}: save to {bundle_path}, size={len(header)+len(payload)}\n")
+
+    return bundle_path
+
+
+def load_bundle(res_root_dir=None, loglv=0):
+    # return (textnorm, segmeter, pronuciation) if the bundle is valid, otherwise None
+    if res_root_dir is None: res_root_dir = textparser.__path__[0]
+    res_root_dir = os.path.abspath(res_root_dir)
+    bundle_path = _bundle_path(res_root_dir)
+    if not os.path.exists(bundle_path):
+        return None
+
+    func_name = f"{sys._getframe().f_code.co_name}"
+    def _invalid(reason):
+        if loglv > 0:
+            sys.stderr.write(f"{func_name}: ignore {bundle_path}, {reason}\n")
+        return None
+
+    with open(bundle_path, 'rb') as f:
+        if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+            return _invalid("bad magic")
+        size, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(size).decode("utf-8"))
+
+        # check versions
+        if header["bundle_version"] != BUNDLE_VERSION or header["version"] != __version__:
+            return _invalid(f"version={header['version']}, bundle version={header['bundle_version']}")
+        if tuple(header["python"]) != tuple(sys.version_info[:2]):
+            return _invalid(f"python={header['python']}")
+        if header.get("code") != _code_hash():
+            return _invalid("python sources of textparser are changed")
+        if header["res_root_dir"] != res_root_dir:
+            return _invalid(f"compiled in {header['res_root_dir']}")
+
+        # check source files, compare hash only if mtime or size is changed
+        sources = header["sources"]
+        if set(sources) != set(_source_paths(res_root_dir)):
+            return _invalid("source files are changed")
+        for path, stamp in sources.items():
+            if not check_stamp(path, stamp):
+                return _invalid(f"{path} is modified")
+
+        modules = pickle.load(f)
+
+    for module in modules.values():
+        _set_loglv(module, loglv)
+
+    if loglv > 0:
+        sys.stderr.write(f"{func_name}: load from {bundle_path} done!\n")
+
+    return modules["textnorm"], modules["segmeter"], modules["pronuciation"]
+
+
+def main():
+
+    res_root_dir, loglv = None, 0
+
+    # parse arguments
+    help_str = f"usage: text-parser-compile OPTIONS...\n\n"
+    help_str += f"Compile resources of text parser into binary lexicons and one bundle, version={__version__}\n\n"
+    help_str += f"The lexicons are saved as {Config.cn_lexicon_path} and {Config.en_lexicon_path},\n"
+    help_str += f"and the bundle is saved as {Config.bundle_path} in resource root directory,\n"
+    help_str += f"they are loaded by text parser directly if all resource files are unchanged.\n\n"
+    help_str += f"Mandatory arguments to long options are mandatory for short options too.\n"
+    help_str += f"    -h, --help               show this help message and exit\n"
+    help_str += f"    -l, --loglv LOGLEVEL     set log level, the optional value is 0, 1 and 2, default={loglv}\n"
+    help_str += f"    -r, --resdir RESDIR      resource root directory, default is the installed package directory\n"
+    help_str += f"    -v, --version            output version information and exit\n\n"
+
+    i = 1
+    while i < len(sys.argv):
+        a = sys.argv[i]
+        if a == "-h" or a == "--help":
+            print(help_str)
+            sys.exit(0)
+        elif a == "-l" or a == "--loglv":
+            i += 1
+            loglv = int(sys.argv[i])
+        elif a == "-r" or a == "--resdir":
+            i += 1
+            res_root_dir = sys.argv[i]
+        elif a == "-v" or a == "--version":
+            print(f"text-parser-compile, version={__version__}"
+                  f"Copyright (c) 2023 wwyuan2023\n"
+                  f"MIT License <https://mit-license.org/>\n\n"
+                  f"Written by Wuwen YUAN.\n")
+            sys.exit(0)
+        else:
+            print(f"Unkown argument {a}\n\n{help_str}")
+            sys.exit(-1)
+        i += 1
+
+    bundle_path = compile_bundle(res_root_dir, loglv=loglv)
+    sys.stderr.write(f"Save to {bundle_path}\n")
+
+
+if __name__ == "__main__":
+
+    main()
@@ -19,4 +19,32 @@ class Config:
     en_special_symbols_paths = ("resources/en.special_symbols.v1", )
     polyphone_paths = ("resources/cn.polyphone.v1", "resources/en-us.polyphone.v1", )
     
+    # run hot loops by numba kernels if numba is installed, it is opt-in:
+    # the kernels are compiled at the first call (several seconds without the on-disk cache of numba),
+    # False is the low-latency setting for cold start, `text-parser-compile` warms the kernels if it is True
+    use_numba = False
+
+    # cache of g2p for english oov, the cache file is sqlite and shared by processes, None to disable it
+    g2p_cache_size = 10000
+    g2p_cache_path = None
+
+    # cache of spelled numbers in text normalizer
+    num2wrd_cache_size = 4096
+
+    # cache of segmented sub-texts of single language in segmenter, 0 to disable it
+    segment_cache_size = 4096
+
+    # optional cache of parsed results of text parser, keyed on resource files, context, nstage and input text,
+    # 0 to disable the cache in memory; the cache file is sqlite and shared by processes, None to disable it,
+    # a relative path is in resource root directory like `g2p_cache_path`; both are disabled by default.
+    # results expire `result_cache_ttl` seconds after they are cached, None to keep them until evicted
+    result_cache_size = 0
+    result_cache_path = None
+    result_cache_ttl = None
+
+    # precompiled resources, built by `text-parser-compile`
+    cn_lexicon_path = "resources/cn.lexicon"
+    en_lexicon_path = "resources/en-us.lexicon"
+    bundle_path = "resources/textparser.bundle"
+    
 
@@ -5,7 +5,7 @@ import re
 
 import textparser
 from textparser import Config
-from textparser.utils import Lang, Syllable, SegText
+from textparser.utils import Lang, Syllable, ColumnSegText, load_segtexts, dump_segtext
 from textparser.third_part import CMUSylBnd
 from textparser.version import __version__
 
@@ -356,9 +356,22 @@ class Pronunciation(object):
         return segtext
 
 
+def _read_segtexts(fid):
+    for line in fid:
+        # read one line
+        line = line.strip()
+        if line == '': continue
+        for i in range(len(line)):
+            if line[i].isspace():
+                break
+        utt_id, utt_text = line[:i].strip(), line[i:].strip()
+        if utt_text == '': continue
+        yield utt_id, ColumnSegText(utt_text)
+
+
 def main():
     
-    file, loglv = sys.stdin, 0
+    file, fmt, loglv = sys.stdin, "text", 0
     
     # parse arguments
     help_str = f"usage: text-pronunciation OPTIONS... [FILE]\n\n"
@@ -368,6 +381,7 @@ def main():
     help_str += f"Mandatory arguments to long options are mandatory for short options too.\n"
     help_str += f"    -h, --help               show this help message and exit\n"
     help_str += f"    -l, --loglv LOGLEVEL     set log level, the optional value is 0, 1 and 2, default={loglv}\n"
+    help_str += f"    -f, --format FORMAT      format of segtext input and output, `text` or `binary`, default={fmt}\n"
     help_str += f"    -v, --version            output version information and exit\n\n"
     
     i = 1
@@ -380,6 +394,10 @@ def main():
             elif a == "-l" or a == "--loglv":
                 i += 1
                 loglv = int(sys.argv[i])
+            elif a == "-f" or a == "--format":
+                i += 1
+                fmt = sys.argv[i]
+                assert fmt in ("text", "binary"), f"unknown format {fmt}"
             elif a == "-v" or a == "--version":
                 print(f"text-pronunciation, version={__version__}"
                       f"Copyright (c) 2023 wwyuan2023\n"
@@ -396,24 +414,25 @@ def main():
     # construct instance
     pronunciation = Pronunciation(loglv=loglv)
 
-    fid = open(file, 'rt') if not hasattr(file, 'read') else file
-    for line in fid:
-        # read one line
-        line = line.strip()
-        if line == '': continue
-        for i in range(len(line)):
-            if line[i].isspace():
-                break
-        utt_id, utt_text = line[:i].strip(), line[i:].strip()
-        if utt_text == '': continue
+    if fmt == "binary":
+        fid = open(file, 'rb') if not hasattr(file, 'read') else file.buffer
+        items = load_segtexts(fid)
+        fout = sys.stdout.buffer
+    else:
+        fid = open(file, 'rt') if not hasattr(file, 'read') else file
+        items = _read_segtexts(fid)
+        fout = sys.stdout
+    for utt_id, segtext in items:
+        utt_text = segtext.printer() if loglv > 0 else None
 
         # polyphone rule
-        segtext = SegText(utt_text)
         utt_id, segtext = pronunciation(utt_id, segtext)
 
         # output
-        line = f"{utt_id}    {segtext.printer()}\n"
-        sys.stdout.write(line)
+        if fmt == "binary":
+            dump_segtext(fout, utt_id, segtext)
+        else:
+            fout.write(f"{utt_id}    {segtext.printer()}\n")
 
         if loglv > 0: # format print
             line = f"{utt_id}    "
@@ -423,6 +442,7 @@ def main():
             line += f"{segtext.printer()}\n"
             sys.stderr.write(line)
     
+    fout.flush()
     if fid.fileno() not in {0, 1, 2}:
         fid.close()
 
@@ -4,14 +4,126 @@ import os, sys
 import re
 import math
 import copy
+import numpy as np
 
 import textparser
 from textparser import Config
-from textparser.utils import Lang, Syllable, SegText
+from textparser.utils import Lang, Syllable, ColumnSegText, dump_segtext, DATrie, Lexicon, LexiconDict, save_lexicon
+from textparser.utils import LRUCache, SqliteStore
+from textparser.utils import jit, use_jit
 from textparser.third_part import G2p
 from textparser.version import __version__
 
 
+def _is_user_dict(dict_path):
+    # user dictionaries are told by the file name, the resource root directory may contain "user" too
+    return 'user' in os.path.basename(dict_path)
+
+
+def _open_lexicon(lexicon_path, loglv=0):
+    # return the compiled lexicon if it is up to date, otherwise None
+    if not os.path.exists(lexicon_path): return None
+    func_name = f"{sys._getframe().f_code.co_name}"
+    try:
+        lexicon = Lexicon(lexicon_path)
+    except ValueError as e:
+        if loglv > 0: sys.stderr.write(f"{func_name}: ignore {lexicon_path}, {e}\n")
+        return None
+    if not lexicon.is_valid():
+        if loglv > 0: sys.stderr.write(f"{func_name}: ignore {lexicon_path}, source files are modified\n")
+        return None
+    if loglv > 0: sys.stderr.write(f"{func_name}: open lexicon {lexicon_path}, word count = {len(lexicon)}\n")
+    return lexicon
+
+
+def _fsm_decode(pids, scorts, offsets, ibeg, max_path, trans_hops, trans_next, trans_cost, eps_next, eps_cost):
+    # kernel of `FSM.decode` for max_path > 0, return the final state and the label index of each step
+    nstep = len(offsets) - 1
+    back_prev = np.zeros((nstep, max_path), dtype=np.int64)
+    back_label = np.zeros((nstep, max_path), dtype=np.int64)
+    scores = np.zeros(1, dtype=np.float64)
+    nodes = np.full(1, ibeg, dtype=np.int64)
+    for i in range(nstep):
+        H, L = len(scores), offsets[i+1] - offsets[i]
+        score = np.empty(H * L, dtype=np.float64)
+        node = np.empty(H * L, dtype=np.int64)
+        for j in range(L):
+            pid, scort = pids[offsets[i]+j], scorts[offsets[i]+j]
+            for k in range(H):
+                # self cost, <eps> hops one by one, then arc cost or `max_cost` of death path
+                c = scort + scores[k]
+                inode = nodes[k]
+                for _ in range(trans_hops[inode, pid]):
+                    c += eps_cost[inode]
+                    inode = eps_next[inode]
+                c += trans_cost[nodes[k], pid]
+                score[j*H+k] = c
+                node[j*H+k] = trans_next[nodes[k], pid]
+        if H * L >= max_path:
+            order = np.argsort(score, kind='mergesort')[:max_path]
+        else:
+            order = np.arange(H * L)
+        for h in range(len(order)):
+            back_prev[i, h] = order[h] % H
+            back_label[i, h] = order[h] // H
+        scores, nodes = score[order], node[order]
+
+    # trace back from the first best
+    k = np.argmin(scores)
+    final = nodes[k]
+    labels = np.zeros(nstep, dtype=np.int64)
+    for i in range(nstep-1, -1, -1):
+        labels[i] = back_label[i, k]
+        k = back_prev[i, k]
+    return final, labels
+
+_fsm_decode_kernel = jit(_fsm_decode)
+
+
+def _split_word(codes1, base1, check1, value1, weight1, codes2, base2, check2, value2, weight2, max_len, weight_sword):
+    # kernel of `SegmenterCN._split_word` over two double-array tries, the second one takes precedence,
+    # return the previous boundary, the trie (1 or 2) and the value index of the best word ending at each position
+    N = len(codes1)
+    best = np.zeros(N+1, dtype=np.float64)
+    found = np.zeros(N+1, dtype=np.bool_)
+    found[0] = True
+    prev = np.full(N+1, -1, dtype=np.int64)
+    src = np.zeros(N+1, dtype=np.int8)
+    index = np.full(N+1, -1, dtype=np.int64)
+    csrc = np.zeros(max_len+1, dtype=np.int8)
+    cindex = np.zeros(max_len+1, dtype=np.int64)
+    for i in range(N):
+        n = min(max_len, N - i)
+        csrc[:] = 0
+        s = 0
+        for l in range(1, n+1):
+            t = base1[s] + codes1[i+l-1]
+            if t >= len(check1) or check1[t] != s: break
+            s = t
+            if value1[s] >= 0:
+                csrc[l], cindex[l] = 1, value1[s]
+        s = 0
+        for l in range(1, n+1):
+            t = base2[s] + codes2[i+l-1]
+            if t >= len(check2) or check2[t] != s: break
+            s = t
+            if value2[s] >= 0:
+                csrc[l], cindex[l] = 2, value2[s]
+        for l in range(1, n+1):
+            if csrc[l] == 0: continue
+            j = i + l
+            prev_weight = best[i] if found[i] else i * weight_sword
+            current_weight = prev_weight + (weight1[cindex[l]] if csrc[l] == 1 else weight2[cindex[l]])
+            if not found[j] or best[j] > current_weight:
+                found[j] = True
+                prev[j] = i
+                best[j] = current_weight
+                src[j], index[j] = csrc[l], cindex[l]
+    return prev, src, index
+
+_split_word_kernel = jit(_split_word)
+
+
 class FSM(object):
     def __init__(self, fsm_path, self_cost=1., max_path=50, loglv=0):
         self.loglv = loglv
@@ -34,26 +146,79 @@ class FSM(object):
         if self.loglv > 0:
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
             sys.stderr.write(f"{func_name}: load fsm from {fsm_path}\n")
+        state_ids, label_ids = dict(), dict()
+        src, dst, lab, cost = [], [], [], []
         with open(fsm_path, 'rt') as f:
             for line in f:
-                line = line.strip()
-                if line == '': continue
-                mr = re.match(r'^(\d+)$', line)
-                if mr:
-                    self.iend = mr.group(1)
-                    continue
                 arr = line.split()
+                if len(arr) == 0: continue
+                if len(arr) == 1 and arr[0].isdigit():
+                    self.iend = arr[0]
+                    continue
                 if len(arr) <= 4: arr.append(0)
                 if arr[2] == '<s>': self.ibeg = arr[0]
-                if arr[0] not in self.fsm:
-                    self.fsm[arr[0]] = {}
-                self.fsm[arr[0]][arr[2]] = (float(arr[4]), arr[1])
-                self.PSet.add(arr[2])
+                src.append(state_ids.setdefault(arr[0], len(state_ids)))
+                dst.append(state_ids.setdefault(arr[1], len(state_ids)))
+                lab.append(label_ids.setdefault(arr[2], len(label_ids)))
+                cost.append(float(arr[4]))
+        state_ids.setdefault(self.iend, len(state_ids))
+        
+        # integer ids of states and labels, the last label id is for labels out of fsm
+        self.states = list(state_ids)
+        self.state_ids = state_ids
+        self.labels = list(label_ids)
+        self.label_ids = label_ids
+        self.PSet = set(self.labels)
+        self.ibeg_id = self.state_ids[self.ibeg]
+        S, L = len(self.states), len(self.labels) + 1
+        eps_id = self.label_ids.get('<eps>', -1)
+
+        # the later arc overrides the former one with the same state and label
+        src, dst, lab = np.array(src, dtype=np.int32), np.array(dst, dtype=np.int32), np.array(lab, dtype=np.int32)
+        cost = np.array(cost, dtype=np.float64)
+        _, index = np.unique((src * L + lab)[::-1], return_index=True)
+        index = np.sort(len(src) - 1 - index)
+        src, dst, lab, cost = src[index], dst[index], lab[index], cost[index]
+
+        # dense transition tables: arc_next[state, label] = state or -1, arc_cost[state, label] = cost
+        arc_next = np.full((S, L), -1, dtype=np.int32)
+        arc_cost = np.zeros((S, L), dtype=np.float64)
+        arc_next[src, lab] = dst
+        arc_cost[src, lab] = cost
+        self.eps_next = arc_next[:, eps_id].copy() if eps_id >= 0 else np.full(S, -1, dtype=np.int32)
+        self.eps_cost = arc_cost[:, eps_id].copy() if eps_id >= 0 else np.zeros(S, dtype=np.float64)
+
+        # epsilon closure: without the arc of label, follow at most 5 <eps> hops until the label is accepted,
+        # trans_hops[state, label] is the number of hops, then trans_cost is the arc cost or `max_cost` of death path
+        node = np.repeat(np.arange(S, dtype=np.int32)[:, None], L, axis=1)
+        label = np.repeat(np.arange(L, dtype=np.int32)[None, :], S, axis=0)
+        hops = np.zeros((S, L), dtype=np.int8)
+        found = arc_next >= 0
+        for _ in range(5):
+            active = ~found & (self.eps_next[node] >= 0)
+            if not active.any(): break
+            node[active] = self.eps_next[node[active]]
+            hops[active] += 1
+            found[active] = arc_next[node[active], label[active]] >= 0
+        self.trans_hops = hops
+        self.trans_next = np.where(found, arc_next[node, label], node).astype(np.int32)
+        self.trans_cost = np.where(found, arc_cost[node, label], self.max_cost)
+
+        # arc list for tracing by `_call_paths`, which needs the dict of dict
+        self.arc_list = (src, lab, dst, cost)
+        self.fsm = None
         
         if self.loglv > 0:
             sys.stderr.write(f"{func_name}: load from {fsm_path} done! \n")
         if self.loglv > 2:
-            sys.stderr.write(f"{func_name}: {self.fsm}")
+            sys.stderr.write(f"{func_name}: {self._build_fsm()}")
+    
+    def _build_fsm(self):
+        if self.fsm is None:
+            self.fsm = dict()
+            for state, label, t, cost in zip(*self.arc_list):
+                self.fsm.setdefault(self.states[state], dict())[self.labels[label]] = (float(cost), self.states[t])
+        return self.fsm
         
     def _paths_ext(self, pstrs, scorts, paths):
         dpaths = []
@@ -122,11 +287,114 @@ class FSM(object):
         _str += "<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<\n"
         return _str
     
+    def _hyps_printer(self, labels, scores, nodes):
+        # hypotheses of one step of `decode`
+        _str = "<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<\n"
+        _str += f"\ttotal path = {len(scores)}\n"
+        for i, (label, score, node) in enumerate(zip(labels, scores, nodes), 1):
+            _str += f"\t{i:4d}:{score:.3f} {label} -> {self.states[node]}\n"
+        _str += "<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<\n"
+        return _str
+    
     def _best_path(self, paths):
         one_best = self._paths_prun(1, paths)[0]
         return one_best[1:]
 
+    def _decode_ext(self, pids, scorts, scores, nodes):
+        # extend all hypotheses by each label at once, in the same order as `_paths_ext`,
+        # return the extended hypotheses and their index `label index * H + previous hypothesis`
+        idx = (nodes[None, :] * self.trans_hops.shape[1] + pids[:, None]).ravel()
+        score = np.add.outer(scorts, scores).ravel() # self cost
+        hops = self.trans_hops.take(idx)
+        next_node = self.trans_next.take(idx)
+        # add costs of <eps> hops one by one, so the sum is the same as `_paths_ext`
+        nhop = hops.max()
+        if nhop > 0:
+            node = idx // self.trans_hops.shape[1]
+            for hop in range(nhop):
+                active = hops > hop
+                score += np.where(active, self.eps_cost.take(node), 0.)
+                node = np.where(active, self.eps_next.take(node), node)
+        score += self.trans_cost.take(idx)
+
+        # prun, the stable sort keeps the order of `_paths_prun`
+        if self.max_path > 0 and len(score) >= self.max_path:
+            back = np.argsort(score, kind='stable')[:self.max_path]
+            return score[back], next_node[back], back
+        return score, next_node, None
+
+    def _decode_jit(self, hpstrs):
+        steps = [['<s>']] + [list(hpos.keys()) for hpos in hpstrs] + [['</s>']]
+        label_ids, unk_id = self.label_ids, len(self.labels)
+        pids = np.array([label_ids.get(p, unk_id) for pstrs in steps for p in pstrs], dtype=np.int64)
+        scorts = np.array([0.] + [hpos[p]*self.self_cost for hpos in hpstrs for p in hpos] + [0.], dtype=np.float64)
+        offsets = np.cumsum([0] + [len(pstrs) for pstrs in steps])
+        final, labels = _fsm_decode_kernel(pids, scorts, offsets, self.ibeg_id, self.max_path,
+            self.trans_hops, self.trans_next, self.trans_cost, self.eps_next, self.eps_cost)
+        best = [steps[i][j] for i, j in enumerate(labels)] + [self.states[final]]
+        if self.loglv > 1:
+            sys.stderr.write(f"best={best}\n")
+        
+        # fill result
+        result = [p for p in best if p not in ['<s>', '</s>', '<eps>']]
+
+        # stupid to try exception
+        if len(result) < len(hpstrs):
+            for i in range(len(hpstrs) - len(result)):
+                result.append(result[-1])
+
+        return result
+
+    def decode(self, hpstrs):
+        # viterbi beam search with backpointers, the result is the same as `_call_paths`
+        if self.max_path > 0 and use_jit(_fsm_decode_kernel):
+            return self._decode_jit(hpstrs)
+        label_ids, unk_id = self.label_ids, len(self.labels)
+        scores, nodes = np.zeros(1, dtype=np.float64), np.array([self.ibeg_id], dtype=np.int32)
+        steps = [['<s>']] + [list(hpos.keys()) for hpos in hpstrs] + [['</s>']]
+        history = []
+        for i, pstrs in enumerate(steps):
+            pids = np.array([label_ids.get(p, unk_id) for p in pstrs], dtype=np.int32)
+            if 0 < i < len(steps) - 1:
+                scorts = np.array([hpstrs[i-1][p]*self.self_cost for p in pstrs], dtype=np.float64)
+            else:
+                scorts = np.zeros(len(pstrs), dtype=np.float64)
+            H = len(scores)
+            scores, nodes, backs = self._decode_ext(pids, scorts, scores, nodes)
+            history.append((H, backs))
+            if self.loglv > 1:
+                labels = [pstrs[(k if backs is None else int(backs[k])) // H] for k in range(len(scores))]
+                sys.stderr.write(f"\t--> {hpstrs[i-1] if 0 < i < len(steps) - 1 else pstrs[0]} : \n"
+                                 f"{self._hyps_printer(labels, scores, nodes)}")
+
+        # trace back from the first best, hypothesis `b` of a step is extended from (b % H) by label (b // H)
+        k = int(np.argmin(scores))
+        best = [self.states[nodes[k]]]
+        for i in range(len(steps)-1, -1, -1):
+            H, backs = history[i]
+            b = k if backs is None else int(backs[k])
+            k, j = b % H, b // H
+            best.append(steps[i][j])
+        best.reverse()
+        if self.loglv > 1:
+            sys.stderr.write(f"best={best}\n")
+
+        # fill result
+        result = [p for p in best if p not in ['<s>', '</s>', '<eps>']]
+
+        # stupid to try exception
+        if len(result) < len(hpstrs):
+            for i in range(len(hpstrs) - len(result)):
+                result.append(result[-1])
+
+        return result
+
     def __call__(self, hpstrs):
+        return self.decode(hpstrs)
+
+    def _call_paths(self, hpstrs):
+        # the search keeping whole paths, which is the reference of `decode` for debugging, it is not used by `__call__`
+        self._build_fsm()
         paths = [ [0., self.ibeg] ]
         # sentence start
         paths = self._paths_ext(['<s>'], [0], paths)
@@ -165,7 +433,7 @@ class FSM(object):
 
 
 class SegmenterCN(object):
-    def __init__(self, res_root_dir=None, loglv=0):
+    def __init__(self, res_root_dir=None, loglv=0, use_lexicon=True):
         self.loglv = loglv
         
         # default resource paths
@@ -174,18 +442,33 @@ class SegmenterCN(object):
             os.path.join(res_root_dir, path)
             for path in Config.cn_dict_paths
         ]
+        self.lexicon_path = os.path.join(res_root_dir, Config.cn_lexicon_path)
         posfsm_path = os.path.join(res_root_dir, Config.cn_pos_path)
 
         self.files_mtime = dict()
         
-        # load dict
+        # load dict, the base dictionaries are opened by mmap from the lexicon compiled by `text-parser-compile`,
+        # the other dictionaries (e.g. user dictionaries) are kept in a small overlay of it
         self.max_word_length = -1
-        self.wordict = dict()
+        lexicon = _open_lexicon(self.lexicon_path, loglv) if use_lexicon else None
+        if lexicon is None:
+            # no lexicon is compiled, build the trie in memory
+            covered = [dict_path for dict_path in self.dict_paths if not _is_user_dict(dict_path)]
+            wordict = dict()
+            for dict_path in covered:
+                wordict.update(self._load(dict_path))
+            lexicon = DATrie(wordict)
+        else:
+            covered = [dict_path for dict_path in self.dict_paths if lexicon.covers(dict_path)]
+            self.max_word_length = lexicon.max_word_length
+        self.wordict = LexiconDict(lexicon)
         for dict_path in self.dict_paths:
-            self.wordict.update(self._load(dict_path))
+            if dict_path not in covered:
+                self.wordict.update(self._load(dict_path))
             self.files_mtime[dict_path] = int(os.stat(dict_path).st_mtime)
         if self.max_word_length > Config.max_word_length:
             self.max_word_length = Config.max_word_length
+        self.wordtrie = self.wordict # for prefix matching in `_split_word`
         
         # create pos fsm
         self.pos_fsm = FSM(posfsm_path, 1.8, 20, loglv=loglv)
@@ -269,6 +552,15 @@ class SegmenterCN(object):
         if self.loglv > 0: sys.stderr.write(f"{func_name}: word count = {len(wordict)}\n")
         return wordict
     
+    def compile_lexicon(self, lexicon_path=None):
+        # compile the dictionaries except user dictionaries into one lexicon file
+        if lexicon_path is None: lexicon_path = self.lexicon_path
+        dict_paths = [dict_path for dict_path in self.dict_paths if not _is_user_dict(dict_path)]
+        wordict = dict()
+        for dict_path in dict_paths:
+            wordict.update(self._load(dict_path))
+        return save_lexicon(lexicon_path, "cn", wordict, sources=dict_paths)
+    
     def _get_info(self, word):
         return self.wordict.get(word)
     
@@ -294,13 +586,15 @@ class SegmenterCN(object):
 
     def update(self):
         for dict_path in self.dict_paths:
-            if 'user' not in dict_path: continue
+            if not _is_user_dict(dict_path): continue
             if self.files_mtime[dict_path] != int(os.stat(dict_path).st_mtime):
+                # only the overlay is rebuilt, the base trie is left alone
                 self.wordict.update(self._load(dict_path))
+                self.files_mtime[dict_path] = int(os.stat(dict_path).st_mtime)
         
     def __call__(self, utt_id, utt_text, utt_mark):
 
-        segtext = SegText()
+        segtext = ColumnSegText()
         if utt_text == "": 
             return utt_id, segtext
 
@@ -344,19 +638,52 @@ class SegmenterCN(object):
         
         return utt_id, segtext
         
+    def _jit_tries(self):
+        # (trie, codes, base, check, value, weight) of the base trie and the overlay for `_split_word_kernel`,
+        # the arrays are rebuilt only for the trie which is replaced, e.g. the overlay after `update`
+        tries = (self.wordtrie.lexicon, self.wordtrie.overlay_trie)
+        cache = getattr(self, "_jit_cache", None)
+        if cache is None:
+            cache = self._jit_cache = [None for _ in tries]
+        for k, trie in enumerate(tries):
+            if cache[k] is not None and cache[k][0] is trie: continue
+            if isinstance(trie, Lexicon):
+                weight = np.asarray(trie.values.weight)
+            else:
+                weight = np.array([info[0] for info in trie.values], dtype=np.float64)
+            cache[k] = (trie, trie.codes, np.asarray(trie.base), np.asarray(trie.check), np.asarray(trie.value), weight)
+        return cache
+
+    def __getstate__(self):
+        # the arrays for kernel are rebuilt after unpickling
+        state = self.__dict__.copy()
+        state.pop("_jit_cache", None)
+        return state
+
+    def _split_word_jit(self, utt_text):
+        (trie1, codes1, *arrays1), (trie2, codes2, *arrays2) = self._jit_tries()
+        codes1 = np.array([codes1.get(ch, len(arrays1[1])) for ch in utt_text], dtype=np.int64)
+        codes2 = np.array([codes2.get(ch, len(arrays2[1])) for ch in utt_text], dtype=np.int64)
+        prev, src, index = _split_word_kernel(codes1, *arrays1, codes2, *arrays2, self.max_word_length, self.WEIGHT_SWORD)
+        prev = [None if i < 0 else i for i in prev.tolist()]
+        info = [None for _ in prev]
+        for j in range(len(prev)):
+            if src[j] > 0:
+                info[j] = (trie1 if src[j] == 1 else trie2).values[index[j]][1:]
+        return self._split_fill(utt_text, prev, info)
+
     def _split_word(self, utt_text):
         N = len(utt_text)
         if N == 0: return None, None
+        if use_jit(_split_word_kernel):
+            return self._split_word_jit(utt_text)
 
         best_prob, prev = [None for _ in range(N+1)], [None for _ in range(N+1)]
         info = [None for _ in range(N+1)]
         best_prob[0] = 0
         for i in range(N):
-            for j in range(i+1, min(N+1,i+1+self.max_word_length)):
-                # matching an enty in the dict
-                current_word = utt_text[i:j]
-                current_info = self.wordict.get(current_word)  # (weight, pinyin, pos, flag)
-                if current_info is None: continue
+            # matching all enties in the dict starting at `i`
+            for j, current_info in self.wordtrie.prefixes(utt_text, i, self.max_word_length): # (weight, pinyin, pos, flag)
                 # get the previous found path, if not exists, use the default value,
                 # which means we may take the previous token as the path.
                 prev_weight = best_prob[i] if best_prob[i] is not None else \
@@ -371,6 +698,11 @@ class SegmenterCN(object):
                     best_prob[j] = current_weight
                     info[j] = current_info[1:] # tuple(pinyin, pos, flag)
             
+        return self._split_fill(utt_text, prev, info)
+
+    def _split_fill(self, utt_text, prev, info):
+        N = len(utt_text)
+
         # get boundaries
         boundaries = [None for _ in range(N+1)] # left boundary
         i = N
@@ -389,7 +721,9 @@ class SegmenterCN(object):
                 current_word = utt_text[prev:i]
                 sword.append(current_word)
                 if info[i] is not None:
-                    sinfo.append(copy.deepcopy(info[i]))
+                    # pinyin is a tuple of str, only the dicts have to be copied
+                    pinyin, hpos, hflag = info[i]
+                    sinfo.append((pinyin, dict(hpos), None if hflag is None else dict(hflag)))
                 else:
                     sinfo.append((None, {'w':0}, None))
                 prev = i
@@ -751,7 +1085,7 @@ class GPosBTree(object):
 
 
 class SegmenterEN(object):
-    def __init__(self, res_root_dir=None, loglv=0):
+    def __init__(self, res_root_dir=None, loglv=0, use_lexicon=True):
         self.loglv = loglv
         
         # default resource paths
@@ -760,6 +1094,7 @@ class SegmenterEN(object):
             os.path.join(res_root_dir, path)
             for path in Config.en_dict_paths
         ]
+        self.lexicon_path = os.path.join(res_root_dir, Config.en_lexicon_path)
         posfsm_path = os.path.join(res_root_dir, Config.en_pos_path)
         postree_path = os.path.join(res_root_dir, Config.en_guesspos_path)
 
@@ -780,15 +1115,22 @@ class SegmenterEN(object):
             "Y": "(w_ay)1", "Z": "(z_iy)1",
         }
         self.g2p = G2p()
+        
+        # memo of lts for oov, optionally backed by a persistent cache file
+        self.res_root_dir = res_root_dir
+        self.lts_cache = self._make_lts_cache()
 
         # guess pos for oov
         self.w2p = GPosBTree(postree_path, loglv)
         self.files_mtime[postree_path] = int(os.stat(postree_path).st_mtime)
         
-        # load dict
-        self.wordict = dict()
+        # load dict, the compiled lexicon replaces the dictionaries it is built from,
+        # which saves g2p and pos guessing of entries without pronunciation or pos
+        lexicon = _open_lexicon(self.lexicon_path, loglv) if use_lexicon else None
+        self.wordict = dict() if lexicon is None else LexiconDict(lexicon)
         for dict_path in self.dict_paths:
-            self.wordict.update(self._load(dict_path))
+            if lexicon is None or not lexicon.covers(dict_path):
+                self.wordict.update(self._load(dict_path))
             self.files_mtime[dict_path] = int(os.stat(dict_path).st_mtime)
         
         # regex compile
@@ -806,6 +1148,22 @@ class SegmenterEN(object):
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
             sys.stderr.write(f"{func_name}: Initialize Success! \n")
 
+    def _make_lts_cache(self):
+        lts_store = None
+        if Config.g2p_cache_path is not None:
+            lts_store = SqliteStore(os.path.join(self.res_root_dir, Config.g2p_cache_path), table="lts")
+        return LRUCache(Config.g2p_cache_size, store=lts_store)
+    
+    def __getstate__(self):
+        # the memo and its store are not pickled into the bundle, they follow the Config at loading
+        state = self.__dict__.copy()
+        state.pop("lts_cache", None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lts_cache = self._make_lts_cache()
+    
     def _load(self, filename):
         wordict = {}
         def _parse_item(line):
@@ -847,6 +1205,15 @@ class SegmenterEN(object):
              sys.stderr.write(f"{func_name}: word count = {len(wordict)}\n")
         return wordict
     
+    def compile_lexicon(self, lexicon_path=None):
+        # compile the dictionaries except user dictionaries into one lexicon file
+        if lexicon_path is None: lexicon_path = self.lexicon_path
+        dict_paths = [dict_path for dict_path in self.dict_paths if not _is_user_dict(dict_path)]
+        wordict = dict()
+        for dict_path in dict_paths:
+            wordict.update(self._load(dict_path))
+        return save_lexicon(lexicon_path, "en", wordict, sources=dict_paths)
+    
     def _get_pinyin(self, word):
         info = self.wordict.get(word)
         if info is None: return None
@@ -857,27 +1224,40 @@ class SegmenterEN(object):
         if info is None: return None
         return info[1]
     
+    def _is_spelled(self, word):
+        # spell letter by letter rather than g2p
+        return len(word) == 1 or self.letter_vowels.search(word) is None \
+            or (len(word) <= 4 and word.isupper())
+    
+    def _spell(self, word):
+        syls = []
+        for w in word:
+            s = self.letter_pron_table.get(w.upper(), None)
+            if s is not None:
+                syls += s.split("-")
+        if len(syls) == 0: syls = None
+        return syls
+    
     def _lts(self, word):
-        if len(word) == 1 or self.letter_vowels.search(word) is None \
-            or (len(word) <= 4 and word.isupper()):
-            syls = []
-            for w in word:
-                s = self.letter_pron_table.get(w.upper(), None)
-                if s is not None:
-                    syls += s.split("-")
-            if len(syls) == 0: syls = None
+        syls = self.lts_cache.get(word, False)
+        if syls is not False:
+            return None if syls is None else list(syls)
+        if self._is_spelled(word):
+            syls = self._spell(word)
         else:  
             syls = self.g2p(word)
+        self.lts_cache.put(word, None if syls is None else tuple(syls))
         return syls
 
     def update(self):
         for dict_path in self.dict_paths:
-            if 'user' not in dict_path: continue
+            if not _is_user_dict(dict_path): continue
             if self.files_mtime[dict_path] != int(os.stat(dict_path).st_mtime):
                 self.wordict.update(self._load(dict_path))
+                self.files_mtime[dict_path] = int(os.stat(dict_path).st_mtime)
 
     def __call__(self, utt_id, utt_text, utt_mark):
-        segtext = SegText()
+        segtext = ColumnSegText()
         if utt_text == "": 
             return utt_id, segtext
 
@@ -896,23 +1276,59 @@ class SegmenterEN(object):
         pos = self.pos_fsm(hpos)
         
         # create segtext list
+        segtext = self._make_segtext(sword, pinyin, pos)
+        
+        return utt_id, segtext
+    
+    def batch(self, utt_ids, utt_texts, utt_marks):
+        # split words of all utterances first, then the oov words of the whole batch share one lts pass
+        swords, pinyins, hposes = [], [], []
+        for utt_text in utt_texts:
+            sword, sinfo = self._split_word(utt_text) if utt_text != "" else (None, None)
+            if not sword or not sinfo:
+                sword, sinfo = [], []
+            swords.append(sword)
+            pinyins.append([x[0] if x is not None else None for x in sinfo])
+            hposes.append([x[1] if x is not None else None for x in sinfo])
+        
+        # letter to sound for oov
+        oov = dict()
+        for sword, pinyin in zip(swords, pinyins):
+            for i in range(len(sword)):
+                if pinyin[i] is None or len(pinyin[i]) == 0:
+                    oov[sword[i]] = None
+        oov = self._lts_batch(list(oov.keys()))
+
+        outputs = []
+        for utt_id, sword, pinyin, hpos in zip(utt_ids, swords, pinyins, hposes):
+            if len(sword) == 0:
+                outputs.append((utt_id, ColumnSegText()))
+                continue
+            pinyin = self._fill_pinyin(sword, pinyin, oov)
+            hpos = self._fill_pos(sword, hpos)
+            pos = self.pos_fsm(hpos)
+            outputs.append((utt_id, self._make_segtext(sword, pinyin, pos)))
+        
+        return outputs
+    
+    def _make_segtext(self, sword, pinyin, pos):
+        segtext = ColumnSegText()
         for i in range(len(sword)):
             segtext.append() # create one empty element
             segtext.set_wpc(-1, sword[i], pinyin[i], pos[i])
             segtext.set_lang(-1, Lang.EN)
             segtext.set_mark(-1, None)
-        
-        return utt_id, segtext
+        return segtext
     
     def _split_word(self, utt_text):
         if len(utt_text) == 0: return None, None
 
         utt_text = self.regex[0].sub(' .', utt_text) # T. => T ., maybe dot is sent
-        arr_text = utt_text.split()
+        arr_text = utt_text.split()[::-1] # stack, the next word is at the end
 
         sword, sinfo = [], []
         while len(arr_text) > 0:
-            word = arr_text.pop(0)
+            word = arr_text.pop()
             info = self.wordict.get(word.upper())
             if info is not None:
                 sword.append(word)
@@ -926,39 +1342,58 @@ class SegmenterEN(object):
             # 根据规则拆分
             mr = self.regex[2].match(word) # '^([\'"])(.+)$'
             if mr:
-                arr_text.insert(0, mr.group(2))
-                arr_text.insert(0, mr.group(1))
+                arr_text.append(mr.group(2))
+                arr_text.append(mr.group(1))
                 continue
             mr = self.regex[3].match(word) # '^([a-z]+)(n\'t|\'ll|\'ve|\'re|\'s|\'m|\'d|\'em|\')$'
             if mr:
-                arr_text.insert(0, mr.group(2))
-                arr_text.insert(0, mr.group(1))
+                arr_text.append(mr.group(2))
+                arr_text.append(mr.group(1))
                 continue
             mr = self.regex[4].match(word) # '^([a-z]+)(\'n\')([a-z])$'
             if mr:
-                arr_text.insert(0, mr.group(3))
-                arr_text.insert(0, mr.group(2))
-                arr_text.insert(0, mr.group(1))
+                arr_text.append(mr.group(3))
+                arr_text.append(mr.group(2))
+                arr_text.append(mr.group(1))
                 continue
             mr = self.regex[5].match(word) # '^([a-z\']+)(.+)$'
             if mr:
-                arr_text.insert(0, mr.group(2))
-                arr_text.insert(0, mr.group(1))
+                arr_text.append(mr.group(2))
+                arr_text.append(mr.group(1))
                 continue
             mr = self.regex[6].match(word) # '^([^a-zA-Z]+)(.+)$'
             if mr:
-                arr_text.insert(0, mr.group(2))
-                arr_text.insert(0, mr.group(1))
+                arr_text.append(mr.group(2))
+                arr_text.append(mr.group(1))
                 continue
             sword.append(word)
             sinfo.append(None)
         
         return sword, sinfo
     
-    def _fill_pinyin(self, sword, pinyin):
+    def _lts_batch(self, words):
+        # same as `_lts` of each word, the words not cached or spelled share batched g2p inference
+        lts = dict()
+        for word in words:
+            syls = self.lts_cache.get(word, False)
+            if syls is not False:
+                lts[word] = None if syls is None else list(syls)
+            elif self._is_spelled(word):
+                lts[word] = self._spell(word)
+                self.lts_cache.put(word, None if lts[word] is None else tuple(lts[word]))
+        words = [word for word in words if word not in lts]
+        lts.update(zip(words, self.g2p.batch(words)))
+        for word in words:
+            self.lts_cache.put(word, None if lts[word] is None else tuple(lts[word]))
+        return lts
+    
+    def _fill_pinyin(self, sword, pinyin, lts=None):
         for i in range(len(sword)):
             if pinyin[i] is None or len(pinyin[i]) == 0:
-                pinyin[i] = self._lts(sword[i])
+                if lts is not None and sword[i] in lts:
+                    pinyin[i] = lts[sword[i]]
+                else:
+                    pinyin[i] = self._lts(sword[i])
         return pinyin
 
     def _fill_pos(self, sword, hpos):
@@ -968,10 +1403,15 @@ class SegmenterEN(object):
         return hpos
 
 class Segmenter(object):
-    def __init__(self, res_root_dir=None, loglv=0):
+    def __init__(self, res_root_dir=None, loglv=0, use_lexicon=True):
         self.loglv = loglv
-        self.segmenter_cn = SegmenterCN(res_root_dir, loglv)
-        self.segmenter_en = SegmenterEN(res_root_dir, loglv)
+        self.segmenter_cn = SegmenterCN(res_root_dir, loglv, use_lexicon=use_lexicon)
+        self.segmenter_en = SegmenterEN(res_root_dir, loglv, use_lexicon=use_lexicon)
+
+        # memo of segmented runs, keyed on (lang, run text, pinyin marks),
+        # each run is segmented independently, so its result does not depend on the neighbour runs
+        self.run_cache = LRUCache(Config.segment_cache_size)
+        self.dict_stamp = self._dict_stamp()
 
         # compile regex
         self.regex = {
@@ -984,9 +1424,38 @@ class Segmenter(object):
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
             sys.stderr.write(f"{func_name}: Initialize Success.\n")
     
+    def __getstate__(self):
+        # `run_cache` is rebuilt by Config.segment_cache_size after unpickling
+        state = self.__dict__.copy()
+        state.pop("run_cache", None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.run_cache = LRUCache(Config.segment_cache_size)
+    
+    def _dict_stamp(self):
+        dict_paths = self.segmenter_cn.dict_paths + self.segmenter_en.dict_paths
+        return tuple([int(os.stat(dict_path).st_mtime) for dict_path in dict_paths])
+    
     def update(self):
         self.segmenter_cn.update()
         self.segmenter_en.update()
+        # segmented runs are invalid once any dictionary is changed
+        stamp = self._dict_stamp()
+        if stamp != self.dict_stamp:
+            self.run_cache.clear()
+            self.dict_stamp = stamp
+
+    def _segment_run(self, utt_id, sub_text, sub_lang, sub_mark):
+        # the cached segtext is never returned to caller, it is only copied by `+=`
+        key = (sub_lang, sub_text, tuple(sub_mark))
+        segtext = self.run_cache.get(key)
+        if segtext is None:
+            segmenter = self.segmenter_en if sub_lang == Lang.EN else self.segmenter_cn
+            _, segtext = segmenter(utt_id, sub_text, sub_mark)
+            self.run_cache.put(key, segtext)
+        return segtext
 
     def _replace_blank_text(self, utt_id, utt_text):
         utt_text = utt_text.strip()
@@ -1071,24 +1540,60 @@ class Segmenter(object):
         utt_id, utt_text = self._replace_blank_text(utt_id, utt_text)
         sub_text, sub_lang, sub_mark = self._split_text(utt_text)
 
-        segtext = SegText()
+        segtext = ColumnSegText()
         for i in range(len(sub_text)):
-            if sub_lang[i] == Lang.EN:
-                _, segtext_ = self.segmenter_en(utt_id, sub_text[i], sub_mark[i])
-            else:
-                _, segtext_ = self.segmenter_cn(utt_id, sub_text[i], sub_mark[i])
-            segtext += segtext_
+            segtext += self._segment_run(utt_id, sub_text[i], sub_lang[i], sub_mark[i])
         
         if self.loglv > 0:
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
             sys.stderr.write(f"{func_name}: output> utt_id={utt_id}, segtext=`{segtext}`\n")
         
         return utt_id, segtext
+    
+    def batch(self, utt_ids, utt_texts):
+        if self.loglv > 0:
+            func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
+            sys.stderr.write(f"{func_name}: input> batch size={len(utt_ids)}\n")
+        
+        # split all utterances, english sub-texts missed in cache are segmented together
+        subs, en_runs, en_subs = [], dict(), []
+        for utt_id, utt_text in zip(utt_ids, utt_texts):
+            utt_id, utt_text = self._replace_blank_text(utt_id, utt_text)
+            sub_text, sub_lang, sub_mark = self._split_text(utt_text)
+            subs.append((sub_text, sub_lang, sub_mark))
+            for i in range(len(sub_text)):
+                if sub_lang[i] != Lang.EN: continue
+                key = (Lang.EN, sub_text[i], tuple(sub_mark[i]))
+                if key in en_runs: continue
+                en_runs[key] = self.run_cache.get(key)
+                if en_runs[key] is None:
+                    en_subs.append((utt_id, sub_text[i], sub_mark[i]))
+        en_segtexts = self.segmenter_en.batch(*zip(*en_subs)) if len(en_subs) > 0 else []
+        for (_, text, mark), (_, segtext_) in zip(en_subs, en_segtexts):
+            key = (Lang.EN, text, tuple(mark))
+            en_runs[key] = segtext_
+            self.run_cache.put(key, segtext_)
+        
+        outputs = []
+        for utt_id, (sub_text, sub_lang, sub_mark) in zip(utt_ids, subs):
+            segtext = ColumnSegText()
+            for i in range(len(sub_text)):
+                if sub_lang[i] == Lang.EN:
+                    segtext += en_runs[(Lang.EN, sub_text[i], tuple(sub_mark[i]))]
+                else:
+                    segtext += self._segment_run(utt_id, sub_text[i], sub_lang[i], sub_mark[i])
+            outputs.append((utt_id, segtext))
+        
+        if self.loglv > 0:
+            for utt_id, segtext in outputs:
+                sys.stderr.write(f"{func_name}: output> utt_id={utt_id}, segtext=`{segtext}`\n")
+        
+        return outputs
 
 
 def main():
     
-    file, loglv = sys.stdin, 0
+    file, fmt, loglv = sys.stdin, "text", 0
     
     # parse arguments
     help_str = f"usage: text-segmenter OPTIONS... [FILE]\n\n"
@@ -1098,6 +1603,7 @@ def main():
     help_str += f"Mandatory arguments to long options are mandatory for short options too.\n"
     help_str += f"    -h, --help               show this help message and exit\n"
     help_str += f"    -l, --loglv LOGLEVEL     set log level, the optional value is 0, 1 and 2, default={loglv}\n"
+    help_str += f"    -f, --format FORMAT      format of segtext output, `text` or `binary`, default={fmt}\n"
     help_str += f"    -v, --version            output version information and exit\n\n"
     
     i = 1
@@ -1110,6 +1616,10 @@ def main():
             elif a == "-l" or a == "--loglv":
                 i += 1
                 loglv = int(sys.argv[i])
+            elif a == "-f" or a == "--format":
+                i += 1
+                fmt = sys.argv[i]
+                assert fmt in ("text", "binary"), f"unknown format {fmt}"
             elif a == "-v" or a == "--version":
                 print(f"text-segmenter, version={__version__}"
                       f"Copyright (c) 2023 wwyuan2023\n"
@@ -1125,6 +1635,7 @@ def main():
     
     # construct instance
     segmenter = Segmenter(loglv=loglv)
+    fout = sys.stdout.buffer if fmt == "binary" else sys.stdout
 
     fid = open(file, 'rt') if not hasattr(file, 'read') else file
     for line in fid:
@@ -1141,8 +1652,10 @@ def main():
         utt_id, segtext = segmenter(utt_id, utt_text)
 
         # output
-        line = f'{utt_id}    {segtext.printer()}\n'
-        sys.stdout.write(line)
+        if fmt == "binary":
+            dump_segtext(fout, utt_id, segtext)
+        else:
+            fout.write(f'{utt_id}    {segtext.printer()}\n')
 
         if loglv > 0: # format print
             line = f"{utt_id}    "
@@ -1152,6 +1665,7 @@ def main():
             line += f"{segtext.printer()}\n"
             sys.stderr.write(line)
     
+    fout.flush()
     if fid.fileno() not in {0, 1, 2}:
         fid.close()
 
@@ -3,24 +3,164 @@
 import os, sys
 import re
 import json
+import operator
+from functools import partial
 
 import textparser
 from textparser import Config
-from textparser.utils import DBC2SBC, Syllable, Lang
+from textparser.utils import DBC2SBC, Syllable, Lang, LRUCache
 from textparser.version import __version__
 
 
+# type of tokens, `M` of rule also matches `S` of token
+token_types = ('H', 'Y', 'S', 'F', 'M')
+
+def _type_match(rule_type, token_type):
+    return rule_type == token_type or (rule_type == 'M' and token_type == 'S')
+
+def _index_rules(rulelist):
+    # map the types of first two tokens to candidate rules, which keeps the order of `rulelist`,
+    # key (type, None) is used when there is only one token.
+    # rules that can not match the leading tokens are dropped, and rules without token never match
+    ruleindex = dict()
+    for t0 in token_types:
+        for t1 in token_types + (None,):
+            ruleindex[(t0, t1)] = tuple([
+                rule for rule in rulelist
+                if len(rule[1]) > 1 and _type_match(rule[1][1], t0)
+                and (len(rule[1]) == 2 or (t1 is not None and _type_match(rule[1][2], t1)))
+            ])
+    return ruleindex
+
+# predicates of token property, which are compiled from `tknprop` of rules when loading,
+# e.g. `1b#"a^b"` -> (0, partial(_pred_in, frozenset(["a", "b"])), -5)
+def _pred_c(op, val, content):
+    return op(len(content), val)
+
+def _pred_z(op, val, content):
+    return op(float(content), val)
+
+def _pred_in(items, content):
+    return content in items
+
+def _pred_notin(items, content):
+    return content not in items
+
+def _pred_contains(items, content):
+    for item in items:
+        if item in content: return True
+    return False
+
+def _pred_contained(items, content):
+    for item in items:
+        if content in item: return True
+    return False
+
+def _pred_upper(pred, content):
+    return pred(content.upper())
+
+def _pred_tail(n, upper, pred, content):
+    content = content[-n:]
+    return pred(content.upper() if upper else content)
+
+def _pred_head(n, upper, pred, content):
+    content = content[:n]
+    return pred(content.upper() if upper else content)
+
+_compare_ops = {'=': operator.eq, '<': operator.lt, '>': operator.gt, '!': operator.ne}
+_regex_num = re.compile(r'^(\d+)')
+
+# tokens of H/Y/S/blanks/F, tried in this order at each position
+_regex_token = re.compile(r"([\u4e00-\u9fa5]+)|([a-zA-Z']+)|(\d+)|(\s+)|(.)", re.S)
+
+def _compile_items(val:str, opr:str):
+    items = val.strip('"').strip('^').split('^')
+    if opr == '#': return partial(_pred_in, frozenset(items))
+    if opr == '!': return partial(_pred_notin, frozenset(items))
+    if opr == '}': return partial(_pred_contains, tuple(items))
+    if opr == '{': return partial(_pred_contained, tuple(items))
+    return None
+
+def _compile_tknprop(tknprop, upper=False):
+    # return ((token index, predicate of token content, error code), ...) in the order of `tknprop`,
+    # `upper` means the content is compared in upper case for `h` and `t`
+    preds = []
+    for tknp, val in tknprop.items():
+        ii, condition, opr = int(tknp[0]) - 1, tknp[1], tknp[2]
+        if condition == 'c':
+            pred, res = partial(_pred_c, _compare_ops[opr], int(val)), -3
+        elif condition == 'z':
+            pred, res = partial(_pred_z, _compare_ops[opr], float(val)), -4
+        elif condition == 'b':
+            pred, res = _compile_items(val, opr), -5
+        elif condition == 'd':
+            pred, res = _compile_items(val, opr), -6
+            if pred is not None: pred = partial(_pred_upper, pred)
+        elif condition in 'ht':
+            mr = _regex_num.match(val)
+            n, val = int(mr.group(1)), val[mr.end(1):]
+            pred, res = _compile_items(val, opr), -7 if condition == 'h' else -8
+            if pred is not None: pred = partial(_pred_head if condition == 'h' else _pred_tail, n, upper, pred)
+        else:
+            continue
+        if pred is None: pred = partial(_pred_in, frozenset()) # unknown operator never matches
+        preds.append((ii, pred, res))
+    return tuple(preds)
+
+
+def _convert_list(n2w, nums_list, cnf="m"):
+    # convert a list of numbers by `n2w`, each distinct (nums, cnf) is converted once,
+    # `cnf` is one flag for all numbers or a list of flags with the same length of `nums_list`
+    cnfs = [cnf] * len(nums_list) if isinstance(cnf, str) else cnf
+    assert len(cnfs) == len(nums_list), f"{len(cnfs)} flags for {len(nums_list)} numbers"
+    words = dict()
+    for key in zip(nums_list, cnfs):
+        if key not in words:
+            words[key] = n2w(*key)
+    return [words[key] for key in zip(nums_list, cnfs)]
+
+
+class _Number(object):
+    # number left by `replace` in batch mode, which is spelled by `convert` together with the whole batch
+    __slots__ = ("nums", "cnf")
+    def __init__(self, nums, cnf):
+        self.nums, self.cnf = nums, cnf
+
+    def __str__(self):
+        return f"<{self.cnf}:{self.nums}>"
+
+
+def _spell_numbers(n2w, pieces_list):
+    # replace the `_Number` pieces of all texts by one call of `n2w.convert`, then join each text
+    where = [(k, i) for k, pieces in enumerate(pieces_list) for i, p in enumerate(pieces) if isinstance(p, _Number)]
+    numbers = [pieces_list[k][i] for k, i in where]
+    words = n2w.convert([x.nums for x in numbers], [x.cnf for x in numbers])
+    for (k, i), w in zip(where, words):
+        pieces_list[k][i] = w
+    return ["".join(pieces) for pieces in pieces_list]
+
+
 class T2S(object):
     def __init__(self, res_file):
         with open(res_file, 'r', encoding="utf-8") as f:
             self.map = json.load(f)
+        
+        # text is mapped char by char, so only keys of single char take effect, the values may be longer
+        chars = {k: v for k, v in self.map.items() if len(k) == 1 and k != v}
+        self.table = str.maketrans(chars)
+        self.chars = frozenset(chars)
     
     def __call__(self, text):
-        return "".join([self.map.get(x, x) for x in text])
+        # skip the text without any traditional char
+        if self.chars.isdisjoint(text):
+            return text
+        return text.translate(self.table)
 
 
 class Num2WrdCN(object):
     def __init__(self):
+        # memo of spelled words, keyed on (nums, cnf)
+        self.cache = LRUCache(Config.num2wrd_cache_size)
         self.DIG = ('零', '一', '二', '三', '四', '五', '六', '七', '八', '九', '十')
         self.YAO = ('零', '幺', '二', '三', '四', '五', '六', '七', '八', '九', '十')
         self.LIA = ('零', '一', '两', '三', '四', '五', '六', '七', '八', '九', '十')
@@ -32,7 +172,28 @@ class Num2WrdCN(object):
         self.TWOTEN = '二十'
         self.ZERO = '零'
 
+    def __getstate__(self):
+        # the memo is left out of the bundle, its size follows Config at loading
+        state = self.__dict__.copy()
+        state.pop("cache", None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cache = LRUCache(Config.num2wrd_cache_size)
+    
     def __call__(self, nums, cnf="m"):
+        key = (nums, cnf)
+        words = self.cache.get(key)
+        if words is None:
+            words = self._convert(nums, cnf)
+            self.cache.put(key, words)
+        return words
+    
+    def convert(self, nums_list, cnf="m"):
+        return _convert_list(self, nums_list, cnf)
+    
+    def _convert(self, nums, cnf="m"):
         nums = DBC2SBC(nums).strip()
         
         if nums == '':
@@ -161,6 +322,7 @@ class TextNormalizerCN(object):
         
         # sort by weight
         self.rulelist = tuple(sorted(rulelist, key=lambda x:x[0], reverse=True))
+        self.ruleindex = _index_rules(self.rulelist)
         
         if self.loglv > 0:
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
@@ -168,14 +330,9 @@ class TextNormalizerCN(object):
         
         # compile regex
         self.regex = {
-            '^([\u4e00-\u9fa5]+)': re.compile(r'^([\u4e00-\u9fa5]+)'),
-            '^([a-zA-Z\']+)': re.compile(r'^([a-zA-Z\']+)'),
-            '^(\d+)': re.compile(r'^(\d+)'),
-            '^(\s+)': re.compile(r'^(\s+)'),
             '^([a-z]{1})<([^>]*)>$': re.compile(r'^([a-z]{1})<([^>]*)>$'),
             '^([a-z]{1})<([^>]+)>': re.compile(r'^([a-z]{1})<([^>]+)>'),
             '<([^>]+)>$': re.compile(r'<([^>]+)>$'),
-            '^(\d+)': re.compile(r'^(\d+)'),
             '^([dtyfismlo]{1})': re.compile(r'^([dtyfismlo]{1})'),
             '^<(.+?)>': re.compile(r'^<(.+?)>'),
             '^(\d+)(.+)$': re.compile(r'^(\d+)(.+)$'),
@@ -301,7 +458,7 @@ class TextNormalizerCN(object):
                 assert check == '', f"{func_name}: unkown result {check} in {line}"
                 result = result.strip(';') # delete last ';'
                 # output
-                rulelist.append((weight, tknlist, tknprop, result))
+                rulelist.append((weight, tknlist, tknprop, result, _compile_tknprop(tknprop)))
                 # trace
                 if self.loglv >= 3:
                     sys.stderr.write(f"line={line}\n")
@@ -320,7 +477,7 @@ class TextNormalizerCN(object):
         return rulelist
 
     def _rule_printer(self, rule: list):
-        weight, tknlist, tknprop, result = rule
+        weight, tknlist, tknprop, result, _ = rule
         _str = "-----------------------------\n"
         _str += f"weight: {weight}\n"
         _str += f"tknlist: "
@@ -347,39 +504,24 @@ class TextNormalizerCN(object):
     def tokenize(self, istr: str):
         istr = DBC2SBC(istr).strip()
 
+        # one pass of the alternation regex, the group index is the token type
         tokenlist = []
-        while istr != '':
-            # H token
-            mr = self.regex['^([\u4e00-\u9fa5]+)'].match(istr)
-            if mr:
-                istr = istr[mr.end(1):]
-                tokenlist.append(['H', mr.group(1)])
-                continue
-            # Y token
-            mr = self.regex['^([a-zA-Z\']+)'].match(istr)
-            if mr:
-                istr = istr[mr.end(1):]
-                tokenlist.append(['Y', mr.group(1)])
-                continue
-            # S token
-            mr = self.regex['^(\d+)'].match(istr)
-            if mr:
-                istr = istr[mr.end(1):]
-                tokenlist.append(['S', mr.group(1)])
-                continue
-            # F token, specail blanks
-            mr = self.regex['^(\s+)'].match(istr)
-            if mr:
-                istr = istr[mr.end(1):]
+        for mr in _regex_token.finditer(istr):
+            k = mr.lastindex
+            tkn = mr.group(k)
+            if k == 1: # H token
+                tokenlist.append(['H', tkn])
+            elif k == 2: # Y token
+                tokenlist.append(['Y', tkn])
+            elif k == 3: # S token
+                tokenlist.append(['S', tkn])
+            elif k == 4: # F token, specail blanks
                 tokenlist.append(['F', ' '])
-                continue
-            # F token
-            ch = istr[0]
-            istr = istr[1:]
-            if len(tokenlist) > 0 and tokenlist[-1][1] == ch and ch in "——……": # 合并特例
-                tokenlist[-1][1] += ch
-            else:
-                tokenlist.append(['F', ch])
+            else: # F token
+                if len(tokenlist) > 0 and tokenlist[-1][1] == tkn and tkn in "——……": # 合并特例
+                    tokenlist[-1][1] += tkn
+                else:
+                    tokenlist.append(['F', tkn])
         
         # post process
         outputs = []
@@ -441,21 +583,24 @@ class TextNormalizerCN(object):
         
         return outputs
 
-    def process(self, tokens):
+    def process(self, tokens, deferred=False):
+        # `tokens` are consumed by cursor `s`, tokens[s-1] is the last token matched by previous rule,
+        # if `deferred`, numbers are left as `_Number` and the pieces are returned without joining
         changed = []
         preToken = None     # 上条规则匹配的最后一个token，用于规则的连接
         preTokenId = None   # 上条规则匹配的最后一个token，用于规则的连接的判断
         preResult = None    # 上条规则匹配的最后一个result，用于规则的连接的判断
         link_rule = 0       # 是否连接上条规则匹配的最后一个token一起匹配，值为0/1
-        while len(tokens) > 0:
+        s, N = 0, len(tokens)
+        while s < N:
             rule_matched = None     # 返回匹配的规则
             ret = None              # 返回匹配的token数目
-            for rule in self.rulelist:
+            start = s - link_rule   # 和前一个token(即tokens[s-1])连接后一起去匹配
+            # only the rules whose first two token types fit are tried
+            key = (tokens[start][0], tokens[start+1][0] if start + 1 < N else None)
+            for rule in self.ruleindex.get(key, self.rulelist):
                 # match rule
-                if link_rule:
-                    ret = self.match([preToken, *tokens], rule) # 和前一个token连接后一起去匹配
-                else:
-                    ret = self.match(tokens, rule)
+                ret = self.match(tokens, rule, start)
                 if ret <= 0:
                     if self.loglv > 2:
                         sys.stderr.write(f"Match Rule:\n")
@@ -466,9 +611,9 @@ class TextNormalizerCN(object):
                 rule_matched = rule
                 break
 
-            weight, tknlist, tknprop, result = rule_matched
+            weight, tknlist, tknprop, result, _ = rule_matched
             if self.loglv > 0:
-                sys.stderr.write(f"Tokens={tokens}\nMatch success:\n")
+                sys.stderr.write(f"Tokens={tokens[s:]}\nMatch success:\n")
                 sys.stderr.write(self._rule_printer(rule_matched))
             # 连接规则的一些情况判断
             if link_rule:
@@ -507,119 +652,49 @@ class TextNormalizerCN(object):
                     link_rule = 0
                     continue
             # replace
-            replaced = self.replace(tokens, result, link_rule)
+            replaced = self.replace(tokens, result, link_rule, s, deferred)
             changed += replaced
             if self.loglv > 1:
-                sys.stderr.write(f"Replaced = " + " ".join(replaced) + "\n")
+                sys.stderr.write(f"Replaced = " + " ".join(map(str, replaced)) + "\n")
             # shift tokens
-            preToken0 = None
-            for i in range(1, len(tknlist) - link_rule):
-                preToken0 = tokens.pop(0)
+            s += len(tknlist) - 1 - link_rule
             # trace token
-            if self.loglv > 1 and len(tokens) > 0:
+            if self.loglv > 1 and s < N:
                 if link_rule:
-                    sys.stderr.write(self._token_printer([preToken, *tokens]))
+                    sys.stderr.write(self._token_printer([preToken, *tokens[s:]]))
                 else:
-                    sys.stderr.write(self._token_printer(tokens))
+                    sys.stderr.write(self._token_printer(tokens[s:]))
             # link rule
-            preToken = preToken0
+            preToken = tokens[s-1]
             preTokenId = len(tknlist) - 1
             preResult = result.split(';').pop(-1)
             if preTokenId > 1: link_rule = 1
 
+        if deferred:
+            return changed
         touched = "".join(changed)
         return touched
     
-    def match(self, tokens, rule):
-        weight, tknlist, tknprop, result = rule
+    def match(self, tokens, rule, start=0):
+        # match tokens[start:] with rule
+        weight, tknlist, tknprop, result, tknpred = rule
         # match token number
-        if len(tokens) < len(tknlist) - 1:
+        if len(tokens) - start < len(tknlist) - 1:
             return -1
         # match token type
         for i in range(1, len(tknlist)):
-            if tknlist[i] != tokens[i-1][0]:
-                if tknlist[i] == 'M' and tokens[i-1][0] == 'S':
+            if tknlist[i] != tokens[start+i-1][0]:
+                if tknlist[i] == 'M' and tokens[start+i-1][0] == 'S':
                     continue
                 return -2
-        # define match functions
-        def match_c(val:str, opr:str, content:str):
-            val, content = int(val), len(content)
-            if opr == '=': return content == val
-            elif opr == '<': return content < val
-            elif opr == '>': return content > val
-            elif opr == '!': return content != val
-            return True
-        def match_z(val:str, opr:str, content:str):
-            val, content = float(val), float(content)
-            if opr == '=': return content == val
-            elif opr == '<': return content < val
-            elif opr == '>': return content > val
-            elif opr == '!': return content != val
-            return True
-        def match_b(val:str, opr:str, content:str):
-            val = val.strip('"').strip('^')
-            items = val.split('^')
-            if opr == '#':
-                if content in items: return True
-            elif opr == '}':
-                for item in items:
-                    if content.find(item) != -1: return True
-            elif opr == '{':
-                for item in items:
-                    if item.find(content) != -1: return True
-            elif opr == '!':
-                return all([content != item for item in items])
-            return False
-        def match_d(val:str, opr:str, content:str):
-            return match_b(val, opr, content.upper())
-        def match_t(val:str, opr:str, content:str):
-            mr = self.regex['^(\d+)'].match(val)
-            n = mr.group(1)
-            val = val[mr.end(1):]
-            content = content[-int(n):]
-            return match_b(val, opr, content)
-        def match_h(val:str, opr:str, content:str):
-            mr = self.regex['^(\d+)'].match(val)
-            n = mr.group(1)
-            val = val[mr.end(1):]
-            content = content[:int(n)]
-            return match_b(val, opr, content)
-        
-        # match token property
-        orres, isorres = -1, -1
-        for tknp in tknprop:
-            val = tknprop[tknp]
-            ii, condition, opr = int(tknp[0]) - 1, tknp[1], tknp[2]
-
-            isor = -1
-            if len(tknp) > 3:
-                isor, isorres = 1, 1
-            if isor == 1 and orres == 1:
-                continue
-
-            res = 0
-            content = tokens[ii][1]
-            if condition == 'c':
-                if not match_c(val, opr, content): res = -3
-            elif condition == 'z':
-                if not match_z(val, opr, content): res = -4
-            elif condition == 'b':
-                if not match_b(val, opr, content): res = -5
-            elif condition == 'd':
-                if not match_d(val, opr, content): res = -6
-            elif condition == 'h':
-                if not match_h(val, opr, content): res = -7
-            elif condition == 't':
-                if not match_t(val, opr, content): res = -8
-            
-            if isor == -1 and res < 0: return res
-            elif isor == 1 and res == 0: orres = 1
-
-        if isorres == 1 and orres != 1: return -9
+        # match token property by predicates compiled when loading
+        for ii, pred, res in tknpred:
+            if not pred(tokens[start+ii][1]): return res
 
         return len(tknlist) - 1 # 返回匹配的token数量
     
-    def replace(self, tokens, result, link_rule):
+    def replace(self, tokens, result, link_rule, start=0, deferred=False):
+        # replace tokens[start:] by result
         def _dtable2word(fh: str, flag: int):
             val = self.dtable.get(fh.upper(), '') if flag else self.dtable.get(fh, fh)
             return val
@@ -641,6 +716,7 @@ class TextNormalizerCN(object):
                 rp = rp[mr.end(1)+1:]
                 if ic.isdigit():
                     i = int(ic) - 1 - link_rule
+                    i = start + i if i >= 0 else i # negative index counts from the end as before
                     cont = tokens[i][1]
                     if len(tokens[i]) > 2: # 判断是否有特殊标记
                         cont = list(cont)
@@ -659,7 +735,7 @@ class TextNormalizerCN(object):
             elif opr == 'f' or opr == 'd':
                 outputs.append(_dtable2word(str_con, 0 if opr == 'f' else 1))
             else: #  opr in 'msilo':
-                outputs.append(self.N2W(str_con, opr))
+                outputs.append(_Number(str_con, opr) if deferred else self.N2W(str_con, opr))
 
         return outputs
     
@@ -674,6 +750,7 @@ class TextNormalizerCN(object):
                 rulelist += self._load(res_path)
                 self.files_mtime[res_path] = int(os.stat(res_path).st_mtime)
             self.rulelist = tuple(sorted(rulelist, key=lambda x:x[0], reverse=True))
+            self.ruleindex = _index_rules(self.rulelist)
 
     def __call__(self, utt_id, utt_text):
         if self.loglv > 0:
@@ -682,22 +759,33 @@ class TextNormalizerCN(object):
             
         utt_text = self.T2S(utt_text)
         utt_text = self.process(self.tokenize(utt_text))
+        utt_text = self._punctuate(utt_text)
 
+        if self.loglv > 0:
+            sys.stderr.write(f"{func_name}: output> utt_id={utt_id}, utt_text=`{utt_text}`\n")
+
+        return utt_id, utt_text
+
+    def batch(self, utt_ids, utt_texts):
+        # the numbers of all texts are spelled by one call of `N2W.convert`, return [(utt_id, utt_text), ...]
+        pieces_list = [self.process(self.tokenize(self.T2S(utt_text)), deferred=True) for utt_text in utt_texts]
+        utt_texts = [self._punctuate(utt_text) for utt_text in _spell_numbers(self.N2W, pieces_list)]
+        return list(zip(utt_ids, utt_texts))
+
+    def _punctuate(self, utt_text):
         # 标点统一替换成全角
         utt_text = utt_text.replace(',', '，')
         utt_text = utt_text.replace('!', '！')
         utt_text = utt_text.replace('?', '？')
         utt_text = utt_text.replace(':', '：')
         utt_text = utt_text.replace(';', '；')
-
-        if self.loglv > 0:
-            sys.stderr.write(f"{func_name}: output> utt_id={utt_id}, utt_text=`{utt_text}`\n")
-
-        return utt_id, utt_text
+        return utt_text
 
 
 class Num2WrdEN(object):
     def __init__(self):
+        # memo of spelled words, keyed on (nums, cnf)
+        self.cache = LRUCache(Config.num2wrd_cache_size)
         self.D = dict(
             [("0", "zero"), ("1", "one"), ("2", "two"), ("3", "three"), ("4", "four"), ("5", "five"), ("6", "six"), ("7", "seven"), ("8", "eight"), ("9", "nine"), 
              ("00", "zero"), ("01", "one"), ("02", "two"), ("03", "three"), ("04", "four"), ("05", "five"), ("06", "six"), ("07", "seven"), ("08", "eight"), ("09", "nine"), 
@@ -953,7 +1041,27 @@ class Num2WrdEN(object):
         m = self._del_front_zero(m)
         return self.Month.get(m, "")
         
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("cache", None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cache = LRUCache(Config.num2wrd_cache_size)
+    
     def __call__(self, nums, cnf="m"):
+        key = (nums, cnf)
+        words = self.cache.get(key)
+        if words is None:
+            words = self._convert(nums, cnf)
+            self.cache.put(key, words)
+        return words
+    
+    def convert(self, nums_list, cnf="m"):
+        return _convert_list(self, nums_list, cnf)
+    
+    def _convert(self, nums, cnf="m"):
         nums = DBC2SBC(nums).strip()
         
         if nums == '':
@@ -1003,6 +1111,7 @@ class TextNormalizerEN(object):
         
         # sort by weight
         self.rulelist = tuple(sorted(rulelist, key=lambda x:x[0], reverse=True))
+        self.ruleindex = _index_rules(self.rulelist)
         
         if self.loglv > 0:
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
@@ -1010,14 +1119,9 @@ class TextNormalizerEN(object):
         
         # compile regex
         self.regex = {
-            '^([\u4e00-\u9fa5]+)': re.compile(r'^([\u4e00-\u9fa5]+)'),
-            '^([a-zA-Z\']+)': re.compile(r'^([a-zA-Z\']+)'),
-            '^(\d+)': re.compile(r'^(\d+)'),
-            '^(\s+)': re.compile(r'^(\s+)'),
             '^([a-z]{1})<([^>]*)>$': re.compile(r'^([a-z]{1})<([^>]*)>$'),
             '^([a-z]{1})<([^>]+)>': re.compile(r'^([a-z]{1})<([^>]+)>'),
             '<([^>]+)>$': re.compile(r'<([^>]+)>$'),
-            '^(\d+)': re.compile(r'^(\d+)'),
             '^([dtyfismnuxeoj]{1})': re.compile(r'^([dtyfismnuxeoj]{1})'),
             '^<(.+?)>': re.compile(r'^<(.+?)>'),
             '^(\d+)(.+)$': re.compile(r'^(\d+)(.+)$'),
@@ -1142,7 +1246,7 @@ class TextNormalizerEN(object):
                 assert check == '', f"{func_name}: unkown result {check} in {line}"
                 result = result.strip(';') # delete last ';'
                 # output
-                rulelist.append((weight, tknlist, tknprop, result))
+                rulelist.append((weight, tknlist, tknprop, result, _compile_tknprop(tknprop, upper=True)))
                 # trace
                 if self.loglv >= 3:
                     sys.stderr.write(f"line={line}\n")
@@ -1161,7 +1265,7 @@ class TextNormalizerEN(object):
         return rulelist
 
     def _rule_printer(self, rule: list):
-        weight, tknlist, tknprop, result = rule
+        weight, tknlist, tknprop, result, _ = rule
         _str = "-----------------------------\n"
         _str += f"weight: {weight}\n"
         _str += f"tknlist: "
@@ -1188,41 +1292,26 @@ class TextNormalizerEN(object):
     def tokenize(self, istr: str):
         istr = DBC2SBC(istr).strip()
 
+        # one pass of the alternation regex, the group index is the token type
         tokenlist = []
-        while istr != '':
-            # H token
-            mr = self.regex['^([\u4e00-\u9fa5]+)'].match(istr)
-            if mr:
-                istr = istr[mr.end(1):]
-                tokenlist.append(['H', mr.group(1)])
-                continue
-            # Y token
-            mr = self.regex['^([a-zA-Z\']+)'].match(istr)
-            if mr:
-                istr = istr[mr.end(1):]
-                tokenlist.append(['Y', mr.group(1)])
-                continue
-            # S token
-            mr = self.regex['^(\d+)'].match(istr)
-            if mr:
-                istr = istr[mr.end(1):]
-                tokenlist.append(['S', mr.group(1)])
-                continue
-            # specail blanks
-            mr = self.regex['^(\s+)'].match(istr)
-            if mr:
-                istr = istr[mr.end(1):]
+        for mr in _regex_token.finditer(istr):
+            k = mr.lastindex
+            tkn = mr.group(k)
+            if k == 1: # H token
+                tokenlist.append(['H', tkn])
+            elif k == 2: # Y token
+                tokenlist.append(['Y', tkn])
+            elif k == 3: # S token
+                tokenlist.append(['S', tkn])
+            elif k == 4: # specail blanks
                 # H/Y/F token can contain blank tail
                 if len(tokenlist) > 0 and tokenlist[-1][0] in "HYF":
-                    tokenlist[-1][1] += mr.group(1)
-                continue
-            # F token
-            ch = istr[0]
-            istr = istr[1:]
-            if len(tokenlist) > 0 and tokenlist[-1][1] == ch and ch in "——……": # 合并特例
-                tokenlist[-1][1] += ch
-            else:
-                tokenlist.append(['F', ch])
+                    tokenlist[-1][1] += tkn
+            else: # F token
+                if len(tokenlist) > 0 and tokenlist[-1][1] == tkn and tkn in "——……": # 合并特例
+                    tokenlist[-1][1] += tkn
+                else:
+                    tokenlist.append(['F', tkn])
         
         # post process
         outputs = []
@@ -1277,21 +1366,24 @@ class TextNormalizerEN(object):
         
         return outputs
 
-    def process(self, tokens):
+    def process(self, tokens, deferred=False):
+        # `tokens` are consumed by cursor `s`, tokens[s-1] is the last token matched by previous rule,
+        # if `deferred`, numbers are left as `_Number` and the pieces are returned without joining
         changed = []
         preToken = None     # 上条规则匹配的最后一个token，用于规则的连接
         preTokenId = None   # 上条规则匹配的最后一个token，用于规则的连接的判断
         preResult = None    # 上条规则匹配的最后一个result，用于规则的连接的判断
         link_rule = 0       # 是否连接上条规则匹配的最后一个token一起匹配，值为0/1
-        while len(tokens) > 0:
+        s, N = 0, len(tokens)
+        while s < N:
             rule_matched = None     # 返回匹配的规则
             ret = None              # 返回匹配的token数目
-            for rule in self.rulelist:
+            start = s - link_rule   # 和前一个token(即tokens[s-1])连接后一起去匹配
+            # only the rules whose first two token types fit are tried
+            key = (tokens[start][0], tokens[start+1][0] if start + 1 < N else None)
+            for rule in self.ruleindex.get(key, self.rulelist):
                 # match rule
-                if link_rule:
-                    ret = self.match([preToken, *tokens], rule) # 和前一个token连接后一起去匹配
-                else:
-                    ret = self.match(tokens, rule)
+                ret = self.match(tokens, rule, start)
                 if ret <= 0:
                     if self.loglv > 2:
                         sys.stderr.write(f"Match Rule:\n")
@@ -1302,9 +1394,9 @@ class TextNormalizerEN(object):
                 rule_matched = rule
                 break
 
-            weight, tknlist, tknprop, result = rule_matched
+            weight, tknlist, tknprop, result, _ = rule_matched
             if self.loglv > 0:
-                sys.stderr.write(f"Tokens={tokens}\nMatch success:\n")
+                sys.stderr.write(f"Tokens={tokens[s:]}\nMatch success:\n")
                 sys.stderr.write(self._rule_printer(rule_matched))
             # 连接规则的一些情况判断
             if link_rule:
@@ -1343,119 +1435,49 @@ class TextNormalizerEN(object):
                     link_rule = 0
                     continue
             # replace
-            replaced = self.replace(tokens, result, link_rule)
+            replaced = self.replace(tokens, result, link_rule, s, deferred)
             changed += replaced
             if self.loglv > 1:
-                sys.stderr.write(f"Replaced = " + " ".join(replaced) + "\n")
+                sys.stderr.write(f"Replaced = " + " ".join(map(str, replaced)) + "\n")
             # shift tokens
-            preToken0 = None
-            for i in range(1, len(tknlist) - link_rule):
-                preToken0 = tokens.pop(0)
+            s += len(tknlist) - 1 - link_rule
             # trace token
-            if self.loglv > 1 and len(tokens) > 0:
+            if self.loglv > 1 and s < N:
                 if link_rule:
-                    sys.stderr.write(self._token_printer([preToken, *tokens]))
+                    sys.stderr.write(self._token_printer([preToken, *tokens[s:]]))
                 else:
-                    sys.stderr.write(self._token_printer(tokens))
+                    sys.stderr.write(self._token_printer(tokens[s:]))
             # link rule
-            preToken = preToken0
+            preToken = tokens[s-1]
             preTokenId = len(tknlist) - 1
             preResult = result.split(';').pop(-1)
             if preTokenId > 1: link_rule = 1
 
+        if deferred:
+            return changed
         touched = "".join(changed)
         return touched
     
-    def match(self, tokens, rule):
-        weight, tknlist, tknprop, result = rule
+    def match(self, tokens, rule, start=0):
+        # match tokens[start:] with rule
+        weight, tknlist, tknprop, result, tknpred = rule
         # match token number
-        if len(tokens) < len(tknlist) - 1:
+        if len(tokens) - start < len(tknlist) - 1:
             return -1
         # match token type
         for i in range(1, len(tknlist)):
-            if tknlist[i] != tokens[i-1][0]:
-                if tknlist[i] == 'M' and tokens[i-1][0] == 'S':
+            if tknlist[i] != tokens[start+i-1][0]:
+                if tknlist[i] == 'M' and tokens[start+i-1][0] == 'S':
                     continue
                 return -2
-        # define match functions
-        def match_c(val:str, opr:str, content:str):
-            val, content = int(val), len(content)
-            if opr == '=': return content == val
-            elif opr == '<': return content < val
-            elif opr == '>': return content > val
-            elif opr == '!': return content != val
-            return True
-        def match_z(val:str, opr:str, content:str):
-            val, content = float(val), float(content)
-            if opr == '=': return content == val
-            elif opr == '<': return content < val
-            elif opr == '>': return content > val
-            elif opr == '!': return content != val
-            return True
-        def match_b(val:str, opr:str, content:str):
-            val = val.strip('"').strip('^')
-            items = val.split('^')
-            if opr == '#':
-                if content in items: return True
-            elif opr == '}':
-                for item in items:
-                    if content.find(item) != -1: return True
-            elif opr == '{':
-                for item in items:
-                    if item.find(content) != -1: return True
-            elif opr == '!':
-                return all([content != item for item in items])
-            return False
-        def match_d(val:str, opr:str, content:str):
-            return match_b(val, opr, content.upper())
-        def match_t(val:str, opr:str, content:str):
-            mr = self.regex['^(\d+)'].match(val)
-            n = mr.group(1)
-            val = val[mr.end(1):]
-            content = content[-int(n):].upper()
-            return match_b(val, opr, content)
-        def match_h(val:str, opr:str, content:str):
-            mr = self.regex['^(\d+)'].match(val)
-            n = mr.group(1)
-            val = val[mr.end(1):]
-            content = content[:int(n)].upper()
-            return match_b(val, opr, content)
-        
-        # match token property
-        orres, isorres = -1, -1
-        for tknp in tknprop:
-            val = tknprop[tknp]
-            ii, condition, opr = int(tknp[0]) - 1, tknp[1], tknp[2]
-
-            isor = -1
-            if len(tknp) > 3:
-                isor, isorres = 1, 1
-            if isor == 1 and orres == 1:
-                continue
-
-            res = 0
-            content = tokens[ii][1].strip()
-            if condition == 'c':
-                if not match_c(val, opr, content): res = -3
-            elif condition == 'z':
-                if not match_z(val, opr, content): res = -4
-            elif condition == 'b':
-                if not match_b(val, opr, content): res = -5
-            elif condition == 'd':
-                if not match_d(val, opr, content): res = -6
-            elif condition == 'h':
-                if not match_h(val, opr, content): res = -7
-            elif condition == 't':
-                if not match_t(val, opr, content): res = -8
-            
-            if isor == -1 and res < 0: return res
-            elif isor == 1 and res == 0: orres = 1
-
-        if isorres == 1 and orres != 1: return -9
+        # match token property by predicates compiled when loading
+        for ii, pred, res in tknpred:
+            if not pred(tokens[start+ii][1].strip()): return res
 
         return len(tknlist) - 1 # 返回匹配的token数量
     
-    def replace(self, tokens, result, link_rule):
+    def replace(self, tokens, result, link_rule, start=0, deferred=False):
+        # replace tokens[start:] by result
         def _dtable2word(fh: str, flag: int):
             # flag: 0=f; 1=d(signular); 2=d(plural)
             if flag > 0:
@@ -1488,6 +1510,7 @@ class TextNormalizerEN(object):
                 rp = rp[mr.end(1)+1:]
                 if ic.isdigit():
                     i = int(ic) - 1 - link_rule
+                    i = start + i if i >= 0 else i # negative index counts from the end as before
                     cont = tokens[i][1]
                     if len(tokens[i]) > 2: # 判断是否有特殊标记
                         cont = list(cont)
@@ -1517,7 +1540,7 @@ class TextNormalizerEN(object):
                 outputs.append(_isolated(str_con))
             else: #  opr in 'smnuxeoj':
                 outputs.append(" ")
-                outputs.append(self.N2W(str_con, opr))
+                outputs.append(_Number(str_con, opr) if deferred else self.N2W(str_con, opr))
                 outputs.append(" ")
             
             last_val = -1
@@ -1540,6 +1563,7 @@ class TextNormalizerEN(object):
                 rulelist += self._load(res_path)
                 self.files_mtime[res_path] = int(os.stat(res_path).st_mtime)
             self.rulelist = tuple(sorted(rulelist, key=lambda x:x[0], reverse=True))
+            self.ruleindex = _index_rules(self.rulelist)
 
     def __call__(self, utt_id, utt_text):
         if self.loglv > 0:
@@ -1547,7 +1571,20 @@ class TextNormalizerEN(object):
             sys.stderr.write(f"{func_name}: input> utt_id={utt_id}, utt_text=`{utt_text}`\n")
             
         utt_text = self.process(self.tokenize(utt_text))
+        utt_text = self._punctuate(utt_text)
 
+        if self.loglv > 0:
+            sys.stderr.write(f"{func_name}: output> utt_id={utt_id}, utt_text=`{utt_text}`\n")
+
+        return utt_id, utt_text
+
+    def batch(self, utt_ids, utt_texts):
+        # the numbers of all texts are spelled by one call of `N2W.convert`, return [(utt_id, utt_text), ...]
+        pieces_list = [self.process(self.tokenize(utt_text), deferred=True) for utt_text in utt_texts]
+        utt_texts = [self._punctuate(utt_text) for utt_text in _spell_numbers(self.N2W, pieces_list)]
+        return list(zip(utt_ids, utt_texts))
+
+    def _punctuate(self, utt_text):
         # 标点统一替换成全角
         utt_text = utt_text.replace(',', '，')
         utt_text = utt_text.replace('!', '！')
@@ -1557,11 +1594,7 @@ class TextNormalizerEN(object):
         
         # 删除多余空白
         utt_text = utt_text.replace('  ', ' ')
-
-        if self.loglv > 0:
-            sys.stderr.write(f"{func_name}: output> utt_id={utt_id}, utt_text=`{utt_text}`\n")
-
-        return utt_id, utt_text
+        return utt_text
 
  
 class TextNormalizer(object):
@@ -1577,6 +1610,10 @@ class TextNormalizer(object):
             'PinyinMark': re.compile(r'^([<\(\[（【]([a-zA-Z]+)(\d)[>\)\]）】])'),
             'Blank': re.compile(r'^(\s+)'),
         }
+    
+    def update(self):
+        self.textnorm_cn.update()
+        self.textnorm_en.update()
         
     def _split_text(self, utt_text):
         # 中英文拆分，注意拼音标记
@@ -1663,32 +1700,58 @@ class TextNormalizer(object):
         
         return sub_text, sub_lang, sub_sent
     
+    def _sub_texts(self, utt_text, context):
+        # [(lang, sub_text), ...], each sub text is normalized by the normalizer of its lang
+        sub_text, sub_lang, sub_sent = self._split_text(utt_text)
+        
+        if context is None: context = ""
+        if context == Lang.CN:
+            return [(Lang.CN, "".join(sub_text))]
+        if context == Lang.EN:
+            return [(Lang.EN, "".join(sub_text))]
+
+        # smart decision
+        sub_texts = []
+        for i in range(len(sub_text)):
+            if (i == len(sub_text) - 1 or sub_sent[i]) and (i == 0 or sub_sent[i-1]) and sub_lang[i] == Lang.EN:
+                sub_texts.append((Lang.EN, sub_text[i]))
+            else:
+                sub_texts.append((Lang.CN, sub_text[i]))
+        return sub_texts
+    
     def __call__(self, utt_id, utt_text, context=Lang.CN):
         if self.loglv > 0:
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
             sys.stderr.write(f"{func_name}: input(context={context})> utt_id={utt_id}, utt_text=`{utt_text}`\n")
         
-        sub_text, sub_lang, sub_sent = self._split_text(utt_text)
-        
-        if context is None: context = ""
-        if context == Lang.CN:
-            _, utt_text = self.textnorm_cn(utt_id, "".join(sub_text))
-        elif context == Lang.EN:
-            _, utt_text = self.textnorm_en(utt_id, "".join(sub_text))
-        else:
-            # smart decision
-            utt_text = ""
-            for i in range(len(sub_text)):
-                if (i == len(sub_text) - 1 or sub_sent[i]) and (i == 0 or sub_sent[i-1]) and sub_lang[i] == Lang.EN:
-                    _, utt_text_ = self.textnorm_en(utt_id, sub_text[i])
-                else:
-                    _, utt_text_ = self.textnorm_cn(utt_id, sub_text[i])
-                utt_text += utt_text_
+        sub_texts, utt_text = self._sub_texts(utt_text, context), ""
+        for lang, sub_text in sub_texts:
+            textnorm = self.textnorm_en if lang == Lang.EN else self.textnorm_cn
+            _, utt_text_ = textnorm(utt_id, sub_text)
+            utt_text += utt_text_
 
         if self.loglv > 0:
             sys.stderr.write(f"{func_name}: output(context={context})> utt_id={utt_id}, utt_text=`{utt_text}`\n")
         
         return utt_id, utt_text
+    
+    def batch(self, utt_ids, utt_texts, context=Lang.CN):
+        # same as calling one by one, but the sub texts of each lang are normalized in one batch,
+        # so that the numbers of the whole batch are spelled together, return [(utt_id, utt_text), ...]
+        parts = [[] for _ in utt_texts]
+        jobs = {Lang.CN: [], Lang.EN: []} # lang -> [(k, i, utt_id, sub_text), ...] for parts[k][i]
+        for k, (utt_id, utt_text) in enumerate(zip(utt_ids, utt_texts)):
+            for lang, sub_text in self._sub_texts(utt_text, context):
+                jobs[lang].append((k, len(parts[k]), utt_id, sub_text))
+                parts[k].append("")
+        
+        for lang, textnorm in ((Lang.CN, self.textnorm_cn), (Lang.EN, self.textnorm_en)):
+            if len(jobs[lang]) == 0: continue
+            outputs = textnorm.batch([job[2] for job in jobs[lang]], [job[3] for job in jobs[lang]])
+            for (k, i, _, _), (_, sub_text) in zip(jobs[lang], outputs):
+                parts[k][i] = sub_text
+        
+        return [(utt_id, "".join(part)) for utt_id, part in zip(utt_ids, parts)]
         
 
 def main():
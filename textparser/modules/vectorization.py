@@ -4,15 +4,98 @@ import os, sys
 import numpy as np
 
 from textparser import Config
-from textparser.utils import GPOS, SenType, Syllable, Phoneme, Tone, Lang, SegText, is_punctuation
+from textparser.utils import GPOS, SenType, Syllable, Phoneme, Tone, Lang, ColumnSegText, load_segtexts, is_punctuation
+from textparser.utils.shard import ShardWriter
 from textparser.version import __version__
 
 
-def one_hot(index, n_class):
-    # assert index < n_class, f"{index} < {n_class}"
-    hot = [0. for _ in range(n_class)]
-    hot[index%n_class] = 1.
-    return hot
+# width of each feature in the 256-dim vector:
+# phoneme, tone, syllable boundary, word boundary, GPOS, sentence type, language id, position
+feature_dims = (Phoneme.phn_num, Tone.tone_num, 2, 2, GPOS.gpos_num, SenType.sentype_num, Lang.lang_num, Config.max_syllable)
+feature_offsets = np.cumsum((0,) + feature_dims[:-1])
+feature_num = len(feature_dims)
+vector_dim = int(sum(feature_dims))
+
+
+def _wrap_index(index, n_class):
+    # the same as indexing a list of length `n_class`
+    if not -n_class <= index < n_class:
+        raise IndexError(f"index {index} is out of range [0, {n_class})")
+    return index % n_class
+
+
+def indices2vector(indices):
+    # expand (N, 8) feature indices to (N, 256) one-hot vector
+    indices = np.asarray(indices)
+    vector = np.zeros((len(indices), vector_dim), dtype=np.int8)
+    if len(indices) > 0:
+        vector[np.arange(len(indices))[:, None], indices.astype(np.int64) + feature_offsets] = 1
+    return vector
+
+
+def vector2indices(vector):
+    # compress (N, 256) one-hot vector to (N, 8) feature indices, which is 32x smaller
+    vector = np.asarray(vector)
+    indices = np.zeros((len(vector), feature_num), dtype=np.uint8)
+    for f in range(feature_num):
+        a = feature_offsets[f]
+        indices[:, f] = np.argmax(vector[:, a:a+feature_dims[f]], axis=1)
+    return indices
+
+
+# field names of decoded record, and names of feature indices
+record_names = ("phoneme", "tone", "syllable_boundary", "word_boundary", "gpos", "sent_type", "lang", "position")
+_phn_names = np.array([Phoneme.idx2phn(i) for i in range(Phoneme.phn_num)])
+_gpos_names = np.array([GPOS.idx2gpos(i) for i in range(GPOS.gpos_num)])
+_sentype_names = np.array([SenType.idx2sentype(i) for i in range(SenType.sentype_num)])
+_lang_names = np.array([Lang.idx2lang(i) for i in range(Lang.lang_num)])
+
+
+def save_vector(outdir, utt_id, vector, fmt="dense", shard=None):
+    # fmt: `dense` saves (N, 256) int8 as `{utt_id}.vec256`, `index` saves (N, 8) uint8 as `{utt_id}.idx8`
+    # the vector is appended to `shard` (a ShardWriter) if given, rather than saved as one file
+    assert fmt in ("dense", "index"), f"unknown format {fmt}"
+    if fmt == "index":
+        if vector.shape[1] != feature_num: vector = vector2indices(vector)
+        outpath = os.path.join(outdir, f"{utt_id}.idx{feature_num}")
+    else:
+        if vector.shape[1] != vector_dim: vector = indices2vector(vector)
+        outpath = os.path.join(outdir, f"{utt_id}.vec{vector_dim}")
+    if shard is not None:
+        path, offset, _ = shard.write(utt_id, vector)
+        return f"{path}:{offset}", vector.shape
+    vector.tofile(outpath)
+    return outpath, vector.shape
+
+
+def read_vector(path, dtype=None):
+    # memory-map a `.vec256` or `.idx8` file as (N, 256) or (N, 8) array, nothing is read until it is accessed.
+    # dtype is int8 for `.vec256` and uint8 for `.idx8` by default, e.g. float32 for vectors dumped as float.
+    name = os.path.basename(path)
+    if name.endswith(f".idx{feature_num}"):
+        dim, dtype = feature_num, np.uint8 if dtype is None else dtype
+    elif name.endswith(f".vec{vector_dim}"):
+        dim, dtype = vector_dim, np.int8 if dtype is None else dtype
+    else:
+        raise ValueError(f"{path} is neither .vec{vector_dim} nor .idx{feature_num} file")
+    dtype = np.dtype(dtype)
+    if dtype.kind not in "iuf":
+        raise ValueError(f"dtype={dtype} is not a number type")
+    size = os.path.getsize(path)
+    if size % (dtype.itemsize * dim) != 0:
+        raise ValueError(f"size of {path} is {size}, which is not a multiple of {dim} x {dtype}")
+    if size == 0:
+        return np.zeros((0, dim), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r').reshape(-1, dim)
+
+
+def load_vector(path, dense=True):
+    # load `.vec256` or `.idx8` file, return (N, 256) int8 if dense else (N, 8) uint8
+    if path.endswith(f".idx{feature_num}"):
+        vector = np.fromfile(path, dtype=np.uint8).reshape(-1, feature_num)
+        return indices2vector(vector) if dense else vector
+    vector = np.fromfile(path, dtype=np.int8).reshape(-1, vector_dim)
+    return vector if dense else vector2indices(vector)
 
 
 class Vectorization(object):
@@ -28,7 +111,8 @@ class Vectorization(object):
     def update(self):
         pass
 
-    def __call__(self, utt_id, segtext):
+    def __call__(self, utt_id, segtext, dense=True):
+        # return (N, 256) int8 one-hot vector if dense, otherwise (N, 8) uint8 feature indices
         if self.loglv > 0:
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
             sys.stderr.write(f"{func_name}: input> utt_id={utt_id}, segtext=`{segtext}`\n")
@@ -36,20 +120,26 @@ class Vectorization(object):
         segtext = self._add_sentype(segtext)
         segtext = self._insert_sil(segtext)
         
-        outputs = []
+        indices = []
         pws = 0 # position of word in sentence
-        for i in range(len(segtext)):
-            #print(f"!!!!!!!!!! {utt_id}  ", segtext.segtext[i])
-            py = segtext.get_py(i)
+        columns = zip(segtext.pinyins(), segtext.gposes(), segtext.langs(), segtext.sentypes())
+        for py, cx, lang, stype in columns:
             if py is None: continue
-            cx, lang, stype = segtext.get_cx(i), segtext.get_lang(i), segtext.get_sentype(i)
-            outputs += self.vectoring(lang, py, cx, stype, pws)
+            if lang is None: lang = Lang.UNKNOW
+            if stype is None: stype = 0
+            indices += self.vectoring_index(lang, py, cx, stype, pws)
             if len(py) == 1 and Syllable.is_sil(py[0]):
                 pws = 0
             else:
                 pws += len(py)
         
-        vector = np.array(outputs, dtype=np.int8)
+        # only the active columns are written into the preallocated vector
+        if not dense:
+            vector = np.array(indices, dtype=np.uint8).reshape(-1, feature_num)
+        elif len(indices) > 0:
+            vector = indices2vector(indices)
+        else:
+            vector = np.array([], dtype=np.int8)
 
         if self.loglv > 0:
             sys.stderr.write(f"{func_name}: output> utt_id={utt_id}, segtext=`{segtext}`\n")
@@ -57,22 +147,24 @@ class Vectorization(object):
         return utt_id, segtext, vector
     
     def _insert_sil(self, segtext):
+        pinyins = segtext.pinyins()
         # 句末是否为sil
-        for i in range(len(segtext)-1, -1, -1):
-            if segtext.get_py(i) is not None:
+        for i in range(len(pinyins)-1, -1, -1):
+            if pinyins[i] is not None:
                 break
-        py = segtext.get_py(i)
+        py = pinyins[i]
         if py is None or not Syllable.is_sil(py[0]):
             segtext.append() # 追加空元素
             segtext.set_wpc(-1, "。", ["sil0"], "w")
             segtext.set_lang(-1, segtext.get_lang(-2))
             segtext.set_sentype(-1, segtext.get_sentype(-2))
+            pinyins.append(["sil0"])
         
         # 开头是否为sil
-        for i in range(len(segtext)):
-            if segtext.get_py(i) is not None:
+        for i in range(len(pinyins)):
+            if pinyins[i] is not None:
                 break
-        py = segtext.get_py(i)
+        py = pinyins[i]
         if py is not None or not Syllable.is_sil(py[0]):
             segtext.insert(0) # 插入空元素
             segtext.set_wpc(0, SenType.idx2sentype(segtext.get_sentype(1)), ["sil0"], "w")
@@ -83,36 +175,44 @@ class Vectorization(object):
     
     def _add_sentype(self, segtext):
         # 添加句子类型
+        words, gposes = segtext.words(), segtext.gposes()
+        sentypes = [0] * len(words)
         stype = 0
-        for i in range(len(segtext)-1, -1, -1):
-            wd = segtext.get_wd(i, '')
-            cx = segtext.get_cx(i, '')
+        for i in range(len(words)-1, -1, -1):
+            wd, cx = words[i] or '', gposes[i] or ''
             if(GPOS.is_punc(cx) and is_punctuation(wd)):
                 stype = SenType.sentype2idx(wd)
-            segtext.set_sentype(i, stype)
+            sentypes[i] = stype
+        segtext.set_sentypes(sentypes)
         
         return segtext
     
     def vectoring(self, lang, pys, cx, stype, pws):
+        # one-hot rows of `vectoring_index`, as lists of float
+        indices = self.vectoring_index(lang, pys, cx, stype, pws)
+        if len(indices) == 0: return []
+        return indices2vector(indices).astype(np.float64).tolist()
+    
+    def vectoring_index(self, lang, pys, cx, stype, pws):
+        # return the index of each feature of each phoneme,
+        # e.g. [(phoneme, tone, syllable boundary, word boundary, GPOS, sentence type, language id, position), ...]
         outs = []
         py_num = len(pys)
+        if py_num == 0: return outs
+        gpos_idx = GPOS.gpos2idx(cx)
+        stype_idx = _wrap_index(stype, SenType.sentype_num)
+        lang_idx = Lang.lang2idx(lang)
         for j in range(py_num):
             py = pys[j]
             py, tone = py[:-1], int(py[-1])
             phns = Syllable.s2p(py) # "wu" -> ("CNuw")
             phn_num = len(phns)
+            tone_idx = _wrap_index(Tone.tone2idx(tone, lang), Tone.tone_num)
+            wb_idx = 1 if j + 1 == py_num else 0
+            pos_idx = (pws+j) % self.max_syllable
             for k in range(phn_num):
-                vec = []
-                phn = phns[k]
-                vec += Phoneme.one_hot(phn)                     # phoneme, [0, 90)
-                vec += Tone.one_hot(tone, lang)                 # tone, [90, 99)
-                vec += one_hot(1 if k + 1 == phn_num else 0, 2) # syllable boundary, [99, 101)
-                vec += one_hot(1 if j + 1 == py_num else 0, 2)  # word boundary, [101, 103)
-                vec += GPOS.one_hot(cx)                         # GPOS, [103, 164)
-                vec += SenType.one_hot(stype)                   # sentence type, [164, 174)
-                vec += Lang.one_hot(lang)                       # language id, [174, 176)
-                vec += one_hot(pws+j, self.max_syllable)        # position of syllable in sentence, [176, 256)
-                outs.append(vec)
+                outs.append((Phoneme.phn2idx(phns[k]), tone_idx, 1 if k + 1 == phn_num else 0, wb_idx,
+                             gpos_idx, stype_idx, lang_idx, pos_idx))
         return outs
     
     def devectoring(self, vector:np.ndarray):
@@ -120,31 +220,41 @@ class Vectorization(object):
         prosody = list()
         if len(vector) == 0: return prosody
         
-        vector = vector.astype(np.int32)
-        wr = np.arange(vector.shape[1])
-        
-        for i in range(len(vector)):
+        records = self.devectoring_records(vector)
+        for r in records:
             prosody.append(dict())
-            prosody[-1]["phoneme"] = Phoneme.idx2phn(np.sum(vector[i,:90] * wr[:90]))
-            prosody[-1]["tone"] = Tone.idx2tone(sum(vector[i,90:99] * wr[:9]))
-            prosody[-1]["syllable_boundary"] = int(sum(vector[i,99:101] * wr[:2]))
-            prosody[-1]["word_boundary"] = int(sum(vector[i,101:103] * wr[:2]))
-            prosody[-1]["gpos"] = GPOS.idx2gpos(sum(vector[i,103:164] * wr[:61]))
-            prosody[-1]["sent_type"] = SenType.idx2sentype(sum(vector[i,164:174] * wr[:10]))
-            prosody[-1]["lang"] = Lang.idx2lang(sum(vector[i,174:176] * wr[:2]))
-            prosody[-1]["position"] = int(sum(vector[i,176:256] * wr[:80]))
+            prosody[-1]["phoneme"] = str(r.phoneme)
+            prosody[-1]["tone"] = r.tone
+            prosody[-1]["syllable_boundary"] = int(r.syllable_boundary)
+            prosody[-1]["word_boundary"] = int(r.word_boundary)
+            prosody[-1]["gpos"] = str(r.gpos)
+            prosody[-1]["sent_type"] = str(r.sent_type)
+            prosody[-1]["lang"] = str(r.lang)
+            prosody[-1]["position"] = int(r.position)
         
         return prosody
+    
+    def devectoring_records(self, vector:np.ndarray):
+        # decode the whole (N, 256) vector or (N, 8) indices by argmax of each feature,
+        # return a record array of N records with the same fields as `devectoring`
+        vector = np.asarray(vector)
+        if vector.ndim < 2: vector = vector.reshape(-1, vector_dim)
+        indices = vector if vector.shape[1] == feature_num else vector2indices(vector)
+        indices = indices.astype(np.int64)
+        columns = [
+            _phn_names[indices[:, 0]],
+            Tone.idx2tones(indices[:, 1]),
+            indices[:, 2],
+            indices[:, 3],
+            _gpos_names[indices[:, 4]],
+            _sentype_names[indices[:, 5]],
+            _lang_names[indices[:, 6]],
+            indices[:, 7],
+        ]
+        return np.rec.fromarrays(columns, names=record_names)
 
 
-def vectorization(file=sys.stdin, outdir=None, loglv=0):
-    
-    if not os.path.exists(outdir):
-        os.makedirs(outdir)
-    
-    vectorization = Vectorization(loglv)
-    
-    fid = open(file, 'rt') if not hasattr(file, 'read') else file
+def _read_segtexts(fid):
     for line in fid:
         # read one line
         line = line.strip()
@@ -154,15 +264,30 @@ def vectorization(file=sys.stdin, outdir=None, loglv=0):
                 break
         utt_id, utt_text = line[:i].strip(), line[i:].strip()
         if utt_text == '': continue
+        yield utt_id, ColumnSegText(utt_text)
+
+
+def vectorization(file=sys.stdin, outdir=None, fmt="dense", shard_size=0, input_fmt="text", loglv=0):
+    
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    shard = ShardWriter(outdir, shard_size=shard_size) if shard_size > 0 else None
+    
+    vectorization = Vectorization(loglv)
     
+    if input_fmt == "binary":
+        fid = open(file, 'rb') if not hasattr(file, 'read') else file.buffer
+        items = load_segtexts(fid)
+    else:
+        fid = open(file, 'rt') if not hasattr(file, 'read') else file
+        items = _read_segtexts(fid)
+    for utt_id, segtext in items:
         # vectorization
-        segtext = SegText(utt_text)
-        utt_id, segtext, vector = vectorization(utt_id, segtext)
+        utt_id, segtext, vector = vectorization(utt_id, segtext, dense=fmt=="dense")
         
         # save and output
-        outpath = os.path.join(outdir, f"{utt_id}.vec{vector.shape[1]}")
-        sys.stderr.write(f"Save to {outpath}, shape={vector.shape}\n")
-        vector.tofile(outpath)
+        outpath, shape = save_vector(outdir, utt_id, vector, fmt=fmt, shard=shard)
+        sys.stderr.write(f"Save to {outpath}, shape={shape}\n")
             
         # checking
         if loglv >= 2:
@@ -170,28 +295,36 @@ def vectorization(file=sys.stdin, outdir=None, loglv=0):
             for p in prosody:
                 print(p)
     
+    if shard is not None:
+        shard.close()
     if fid.fileno() not in {0, 1, 2}:
         fid.close()
 
 
-def devectorization(file=sys.stdin):
+def devectorization(file=sys.stdin, fmt="dense", dtype=None):
     vectorization = Vectorization()
-    fid = open(file, 'rb') if not hasattr(file, 'read') else file
-    if fid.fileno() == 0:
-        buff = fid.buffer.read()
+    if not hasattr(file, 'read') and file.endswith(f".idx{feature_num}"): fmt = "index"
+    dim = feature_num if fmt == "index" else vector_dim
+    if dtype is None: dtype = np.uint8 if fmt == "index" else np.int8
+    if not hasattr(file, 'read') and os.path.basename(file).endswith((f".idx{feature_num}", f".vec{vector_dim}")):
+        vector = read_vector(file, dtype=dtype)
     else:
-        buff = fid.read()
-    vector = np.frombuffer(buff, dtype=np.float32).reshape(-1, 256)
+        fid = open(file, 'rb') if not hasattr(file, 'read') else file
+        buff = fid.buffer.read() if hasattr(fid, 'buffer') else fid.read()
+        if fid.fileno() not in {0, 1, 2}:
+            fid.close()
+        dtype = np.dtype(dtype)
+        if len(buff) % (dtype.itemsize * dim) != 0:
+            raise ValueError(f"size of input is {len(buff)}, which is not a multiple of {dim} x {dtype}")
+        vector = np.frombuffer(buff, dtype=dtype).reshape(-1, dim)
     prosody = vectorization.devectoring(vector)
     for p in prosody:
         print(p)
-    if fid.fileno() not in {0, 1, 2}:
-        fid.close()
 
 
 def main():
     
-    file, outdir, _d, loglv = sys.stdin, None, False, 0
+    file, outdir, _d, fmt, dtype, shard_size, input_fmt, loglv = sys.stdin, None, False, "dense", None, 0, "text", 0
     
     # parse arguments
     help_str = f"usage: text-vectorization OPTIONS... [FILE]\n\n"
@@ -201,8 +334,15 @@ def main():
     help_str += f"Mandatory arguments to long options are mandatory for short options too.\n"
     help_str += f"    -h, --help               show this help message and exit\n"
     help_str += f"    -d                       de-vectorization for debug, FILE must be vectorization file\n"
+    help_str += f"    -f, --format FORMAT      format of vectorization file, `dense` for (N, 256) one-hot vector,\n"
+    help_str += f"                             `index` for (N, 8) feature indices, default={fmt}\n"
     help_str += f"    -l, --loglv LOGLEVEL     set log level,  the optional value is 0, 1 and 2, default={loglv}\n"
     help_str += f"    -o, --outdir OUTDIR      directory to save vectorization of parsed result\n"
+    help_str += f"    -i, --input-format FORMAT  format of input segtext, `text` or `binary`, default={input_fmt}\n"
+    help_str += f"    -t, --dtype DTYPE        data type of vectorization file for -d, e.g. int8 or float32,\n"
+    help_str += f"                             default is int8 for `dense` and uint8 for `index`\n"
+    help_str += f"    -s, --shard-size SIZE    save vectorization into shards of about SIZE MB in OUTDIR,\n"
+    help_str += f"                             rather than one file per line, 0 means no shard, default={shard_size}\n"
     help_str += f"    -v, --version            output version information and exit\n\n"
     
     i = 1
@@ -220,6 +360,20 @@ def main():
                 outdir = sys.argv[i]
             elif a == "-d":
                 _d = True
+            elif a == "-f" or a == "--format":
+                i += 1
+                fmt = sys.argv[i]
+                assert fmt in ("dense", "index"), f"unknown format {fmt}"
+            elif a == "-i" or a == "--input-format":
+                i += 1
+                input_fmt = sys.argv[i]
+                assert input_fmt in ("text", "binary"), f"unknown format {input_fmt}"
+            elif a == "-t" or a == "--dtype":
+                i += 1
+                dtype = np.dtype(sys.argv[i])
+            elif a == "-s" or a == "--shard-size":
+                i += 1
+                shard_size = int(float(sys.argv[i]) * (1 << 20))
             elif a == "-v" or a == "--version":
                 print(f"text-parser, version={__version__}"
                       f"Copyright (c) 2023 wwyuan2023\n"
@@ -235,9 +389,9 @@ def main():
     assert (outdir is None and _d) or (outdir is not None and not _d), f"--outdir or -d must be given!\n"
     
     if _d:
-        devectorization(file)
+        devectorization(file, fmt=fmt, dtype=dtype)
     else:
-        vectorization(file, outdir, loglv=loglv)
+        vectorization(file, outdir, fmt=fmt, shard_size=shard_size, input_fmt=input_fmt, loglv=loglv)
 
 
 if __name__ == "__main__":
@@ -1,35 +1,136 @@
 # coding: utf-8
 
 import os, sys
+import gc
+import json
+import base64
+import hashlib
+import itertools
+import multiprocessing
+import numpy as np
 
+import textparser
 from textparser import Config
 from textparser.modules import TextNormalizer, Segmenter, Pronunciation, Vectorization
-from textparser.utils import Lang
+from textparser.modules.vectorization import save_vector, indices2vector, vector2indices, feature_num
+from textparser.utils.shard import ShardWriter
+from textparser.bundle import load_bundle
+from textparser.utils import Lang, ColumnSegText, LRUCache, SqliteStore, file_stamp
 from textparser.version import __version__
 
+def _resource_paths(obj, visited=None):
+    # resource files that the modules and their members are loaded from, recorded in their `files_mtime`
+    if visited is None: visited = set()
+    if id(obj) in visited or not hasattr(obj, "__dict__"): return []
+    visited.add(id(obj))
+    paths = list(getattr(obj, "files_mtime", dict()).keys())
+    for member in vars(obj).values():
+        if hasattr(member, "loglv"):
+            paths += _resource_paths(member, visited)
+    return paths
+
+
+def _copy_result(utt_text, utt_segtext, utt_vector):
+    return (
+        utt_text,
+        None if utt_segtext is None else utt_segtext.copy(),
+        None if utt_vector is None else utt_vector.copy(),
+    )
+
+def _encode_result(value):
+    # (utt_text, segtext, vector) -> json value of the persistent store, vector is saved as feature indices
+    utt_text, utt_segtext, utt_vector = value
+    segtext = None if utt_segtext is None else base64.b64encode(utt_segtext.dumps()).decode("ascii")
+    if utt_vector is None:
+        vector = None
+    elif utt_vector.ndim == 1: # empty vector
+        vector = ""
+    else:
+        vector = base64.b64encode(vector2indices(utt_vector).tobytes()).decode("ascii")
+    return [utt_text, segtext, vector]
+
+def _decode_result(value):
+    utt_text, segtext, vector = value
+    if segtext is not None:
+        segtext = ColumnSegText.loads(base64.b64decode(segtext))
+    if vector == "":
+        vector = np.array([], dtype=np.int8)
+    elif vector is not None:
+        vector = indices2vector(np.frombuffer(base64.b64decode(vector), dtype=np.uint8).reshape(-1, feature_num))
+    return utt_text, segtext, vector
+
+
 class TextParser(object):
     def __init__(self, res_roor_dir=None, context="", loglv=0):
         self.context = context
         self.loglv = loglv
         self.max_utt_length = Config.max_syllable # max syllale number of each sub-utterance
 
-        self.textnorm = TextNormalizer(res_roor_dir, loglv=loglv)
-        self.segmeter = Segmenter(res_roor_dir, loglv=loglv)
-        self.pronuciation = Pronunciation(res_roor_dir, loglv=loglv)
+        # load the precompiled bundle if it is up to date, otherwise parse resource files
+        modules = load_bundle(res_roor_dir, loglv=loglv)
+        if modules is not None:
+            self.textnorm, self.segmeter, self.pronuciation = modules
+        else:
+            self.textnorm = TextNormalizer(res_roor_dir, loglv=loglv)
+            self.segmeter = Segmenter(res_roor_dir, loglv=loglv)
+            self.pronuciation = Pronunciation(res_roor_dir, loglv=loglv)
         self.vectorization = Vectorization(loglv=loglv)
         
+        # cache of parsed results, keyed on stamp of resource files, context, nstage and input text,
+        # results are kept as objects in memory, and encoded into json in the optional persistent store
+        store = None
+        if Config.result_cache_path is not None:
+            res_root_dir = textparser.__path__[0] if res_roor_dir is None else res_roor_dir
+            # the entries with expire time are kept in their own table
+            table = "cache" if Config.result_cache_ttl is None else "cache_ttl"
+            store = SqliteStore(os.path.join(res_root_dir, Config.result_cache_path), table=table)
+        self.result_cache = LRUCache(Config.result_cache_size, store=store, codec=(_encode_result, _decode_result),
+            ttl=Config.result_cache_ttl)
+        self.resource_stamp = self._resource_stamp()
+        
         if self.loglv > 0:
             func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
             sys.stderr.write(f"{func_name}: Successful !\n")
     
+    def _resource_stamp(self):
+        stamps = []
+        for path in sorted(set(_resource_paths(self))):
+            stamps.append((path, file_stamp(path, sha1=False) if os.path.exists(path) else None))
+        stamps = json.dumps([__version__, stamps], ensure_ascii=False)
+        return hashlib.sha1(stamps.encode("utf-8")).hexdigest()[:16]
+    
+    def _cache_enabled(self):
+        # no cache until resources are reloaded successfully, see `update`
+        if self.resource_stamp is None: return False
+        return self.result_cache.maxsize > 0 or self.result_cache.store is not None
+    
+    def _cache_key(self, utt_text, context, nstage):
+        return f"{self.resource_stamp}\t{context}\t{nstage}\t{utt_text}"
+    
+    def _cache_get(self, key):
+        # return copies, the cached result must not be changed by caller
+        value = self.result_cache.get(key)
+        if value is None: return None
+        return _copy_result(*value)
+    
+    def _cache_put(self, key, utt_text, utt_segtext, utt_vector):
+        self.result_cache.put(key, _copy_result(utt_text, utt_segtext, utt_vector))
+    
     def update(self):
-        try:
-            self.textnorm.update()
-            self.segmeter.update()
-            self.pronuciation.update()
-            self.vectorization.update()
-        except:
-            pass
+        # reload changed resource files module by module, then the results cached with old resources are dropped
+        success = True
+        for module in (self.textnorm, self.segmeter, self.pronuciation, self.vectorization):
+            try:
+                module.update()
+            except (OSError, ValueError) as e:
+                success = False
+                if self.loglv > 0:
+                    func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
+                    sys.stderr.write(f"{func_name}: failed to update {module.__class__.__name__}, {e}\n")
+        stamp = self._resource_stamp() if success else None
+        if stamp != self.resource_stamp:
+            self.result_cache.clear()
+            self.resource_stamp = stamp
 
     def __call__(self, utt_id, utt_text, context=None, nstage=4):
 
@@ -40,11 +141,20 @@ class TextParser(object):
             sys.stderr.write(f"{func_name}: Parse input text, nstate={nstage}, utt_id={utt_id}, utt_text=`{utt_text}`\n")
         
         utt_segtext, utt_vector = None, None
+        context = self.context if context is None else context
         
-        if nstage > 0: utt_id, utt_text = self.textnorm(utt_id, utt_text, context=self.context if context is None else context)
-        if nstage > 1: utt_id, utt_segtext = self.segmeter(utt_id, utt_text)
-        if nstage > 2: utt_id, utt_segtext = self.pronuciation(utt_id, utt_segtext)
-        if nstage > 3: utt_id, utt_segtext, utt_vector = self.vectorization(utt_id, utt_segtext)
+        key = self._cache_key(utt_text, context, nstage) if self._cache_enabled() else None
+        result = self._cache_get(key) if key is not None else None
+        if result is not None:
+            if self.loglv > 0:
+                sys.stderr.write(f"{func_name}: Hit cache, utt_id={utt_id}\n")
+            utt_text, utt_segtext, utt_vector = result
+        else:
+            if nstage > 0: utt_id, utt_text = self.textnorm(utt_id, utt_text, context=context)
+            if nstage > 1: utt_id, utt_segtext = self.segmeter(utt_id, utt_text)
+            if nstage > 2: utt_id, utt_segtext = self.pronuciation(utt_id, utt_segtext)
+            if nstage > 3: utt_id, utt_segtext, utt_vector = self.vectorization(utt_id, utt_segtext)
+            if key is not None: self._cache_put(key, utt_text, utt_segtext, utt_vector)
 
         if self.loglv > 0 and utt_segtext is not None:
             sys.stderr.write(f"{func_name}: Parse done! utt_id={utt_id}, utt_segtext=`{utt_segtext}`\n")
@@ -56,10 +166,103 @@ class TextParser(object):
 
         return utt_id, utt_text, utt_segtext, utt_vector
 
+    def parse_batch(self, items, context=None, nstage=4):
+        # items: [(utt_id, utt_text), ...], return results in the same order of items
+
+        nstage = 4 if nstage < 1 else nstage
+        context = self.context if context is None else context
+
+        if self.loglv > 0:
+            func_name = f"{self.__class__.__name__}::{sys._getframe().f_code.co_name}"
+            sys.stderr.write(f"{func_name}: Parse input batch, nstate={nstage}, batch size={len(items)}\n")
+
+        utt_ids = [utt_id for utt_id, _ in items]
+        utt_texts = [utt_text for _, utt_text in items]
+        utt_segtexts = [None for _ in items]
+        utt_vectors = [None for _ in items]
+
+        # take the cached results, only the missed items are parsed
+        keys = [self._cache_key(utt_text, context, nstage) for utt_text in utt_texts] if self._cache_enabled() else None
+        todo = list(range(len(items)))
+        if keys is not None:
+            todo = []
+            for i, key in enumerate(keys):
+                result = self._cache_get(key)
+                if result is None:
+                    todo.append(i)
+                else:
+                    utt_texts[i], utt_segtexts[i], utt_vectors[i] = result
+        ids = [utt_ids[i] for i in todo]
+        texts = [utt_texts[i] for i in todo]
+        segtexts = [None for _ in todo]
+        vectors = [None for _ in todo]
+
+        # process stage by stage
+        if nstage > 0:
+            texts = [utt_text for _, utt_text in self.textnorm.batch(ids, texts, context=context)]
+        if nstage > 1:
+            segtexts = [utt_segtext for _, utt_segtext in self.segmeter.batch(ids, texts)]
+        if nstage > 2:
+            segtexts = [self.pronuciation(utt_id, utt_segtext)[1] for utt_id, utt_segtext in zip(ids, segtexts)]
+        if nstage > 3:
+            outputs = [self.vectorization(utt_id, utt_segtext) for utt_id, utt_segtext in zip(ids, segtexts)]
+            segtexts = [utt_segtext for _, utt_segtext, _ in outputs]
+            vectors = [utt_vector for _, _, utt_vector in outputs]
+
+        for j, i in enumerate(todo):
+            utt_texts[i], utt_segtexts[i], utt_vectors[i] = texts[j], segtexts[j], vectors[j]
+            if keys is not None: self._cache_put(keys[i], texts[j], segtexts[j], vectors[j])
+
+        if self.loglv > 0:
+            sys.stderr.write(f"{func_name}: Parse batch done! batch size={len(items)}\n")
+
+        return list(zip(utt_ids, utt_texts, utt_segtexts, utt_vectors))
+
+
+# parser of each worker process, constructed once by `_worker_init`
+_worker_parser = None
+
+def _worker_init(res_root_dir, context, loglv):
+    global _worker_parser
+    _worker_parser = TextParser(res_root_dir, context=context, loglv=loglv)
+
+def _worker_parse(args):
+    items, context, nstage = args
+    return _worker_parser.parse_batch(items, context=context, nstage=nstage)
+
+def create_pool(jobs, res_root_dir=None, context="", loglv=0):
+    # create a process pool whose workers parse by `_worker_parse`
+    if "fork" in multiprocessing.get_all_start_methods():
+        # load resources once in this process, the forked workers share them by copy-on-write;
+        # freeze the loaded objects so that gc in workers never writes (and copies) their pages
+        global _worker_parser
+        _worker_parser = TextParser(res_root_dir, context=context, loglv=loglv)
+        if hasattr(gc, "freeze"):
+            gc.collect()
+            gc.freeze()
+        return multiprocessing.get_context("fork").Pool(jobs)
+    # spawned workers have to load resources by themselves
+    return multiprocessing.Pool(jobs, initializer=_worker_init, initargs=(res_root_dir, context, loglv))
+
+
+def _read_items(fid):
+    for line in fid:
+        # read one line
+        line = line.strip()
+        if line == '': continue
+        for i in range(len(line)):
+            if line[i].isspace():
+                break
+        utt_id, utt_text = line[:i].strip(), line[i:].strip()
+        if utt_text == '':
+            continue
+        yield utt_id, utt_text
+
 
 def main():
     
-    file, outdir, context, loglv = sys.stdin, None, "", 0
+    file, outdir, context, loglv, jobs, fmt, shard_size = sys.stdin, None, "", 0, 1, "dense", 0
+    batch_size = 64 # number of lines sent to worker at a time
     
     # parse arguments
     help_str = f"usage: text-parser OPTIONS... [FILE]\n\n"
@@ -71,6 +274,11 @@ def main():
     help_str += f"    -l, --loglv LOGLEVEL     set log level, the optional value is 0, 1 and 2, default={loglv}\n"
     help_str += f"    -c, --context CONTEXT    set language context, the optional value is CN, EN or \"\", default=\"{context}\"\n"
     help_str += f"    -o, --outdir OUTDIR      directory to save vectorization of parsed result\n"
+    help_str += f"    -f, --format FORMAT      format of saved vectorization, `dense` for (N, 256) one-hot vector in `.vec256`,\n"
+    help_str += f"                             `index` for (N, 8) feature indices in `.idx8`, default={fmt}\n"
+    help_str += f"    -s, --shard-size SIZE    save vectorization into shards of about SIZE MB in OUTDIR,\n"
+    help_str += f"                             rather than one file per line, 0 means no shard, default={shard_size}\n"
+    help_str += f"    -j, --jobs JOBS          number of worker processes, default={jobs}\n"
     help_str += f"    -v, --version            output version information and exit\n\n"
     
     i = 1
@@ -89,6 +297,16 @@ def main():
             elif a == "-o" or a == "--outdir":
                 i += 1
                 outdir = sys.argv[i]
+            elif a == "-f" or a == "--format":
+                i += 1
+                fmt = sys.argv[i]
+                assert fmt in ("dense", "index"), f"unknown format {fmt}"
+            elif a == "-s" or a == "--shard-size":
+                i += 1
+                shard_size = int(float(sys.argv[i]) * (1 << 20))
+            elif a == "-j" or a == "--jobs":
+                i += 1
+                jobs = int(sys.argv[i])
             elif a == "-v" or a == "--version":
                 print(f"text-parser, version={__version__}"
                       f"Copyright (c) 2023 wwyuan2023\n"
@@ -104,31 +322,31 @@ def main():
     
     if outdir is not None and not os.path.exists(outdir):
         os.makedirs(outdir)
+    shard = ShardWriter(outdir, shard_size=shard_size) if outdir is not None and shard_size > 0 else None
     
-    # construnt instance
-    parser = TextParser(context=context, loglv=loglv)
-
     nstage = 3 if outdir is None else 4
     fid = open(file, 'rt') if not hasattr(file, 'read') else file
-    for line in fid:
-        # read one line
-        line = line.strip()
-        if line == '': continue
-        for i in range(len(line)):
-            if line[i].isspace():
-                break
-        utt_id, utt_text = line[:i].strip(), line[i:].strip()
-        if utt_text == '':
-            continue
+    items = _read_items(fid)
+
+    if jobs > 1:
+        # shard lines across worker processes, which share one loaded instance if possible
+        pool = create_pool(jobs, context=context, loglv=loglv)
+        batches = iter(lambda: list(itertools.islice(items, batch_size)), [])
+        results = itertools.chain.from_iterable(
+            pool.imap(_worker_parse, ((batch, context, nstage) for batch in batches))
+        )
+    else:
+        # construnt instance
+        parser = TextParser(context=context, loglv=loglv)
+        results = (parser(utt_id, utt_text, context=context, nstage=nstage) for utt_id, utt_text in items)
 
-        # parse results
-        utt_id, utt_text, utt_segtext, utt_vector = parser(utt_id, utt_text, context=context, nstage=nstage)
+    # results are in the same order of input lines
+    for utt_id, utt_text, utt_segtext, utt_vector in results:
 
         # save
         if outdir is not None:
-            outpath = os.path.join(outdir, f"{utt_id}.vec{utt_vector.shape[1]}")
-            sys.stderr.write(f"Save to {outpath}, shape={utt_vector.shape}\n")
-            utt_vector.tofile(outpath)
+            outpath, shape = save_vector(outdir, utt_id, utt_vector, fmt=fmt, shard=shard)
+            sys.stderr.write(f"Save to {outpath}, shape={shape}\n")
 
         # output
         line = f"{utt_id}    {utt_text}\n"
@@ -136,6 +354,17 @@ def main():
         line = f"{utt_id}    {utt_segtext}\n"
         sys.stdout.write(line)
     
+    if jobs > 1:
+        pool.close()
+        pool.join()
+    elif loglv > 0:
+        sys.stderr.write(f"G2P cache: {parser.segmeter.segmenter_en.lts_cache.stats()}\n")
+        sys.stderr.write(f"Num2Wrd cache: CN {parser.textnorm.textnorm_cn.N2W.cache.stats()}, EN {parser.textnorm.textnorm_en.N2W.cache.stats()}\n")
+        sys.stderr.write(f"Segment cache: {parser.segmeter.run_cache.stats()}\n")
+        sys.stderr.write(f"Result cache: {parser.result_cache.stats()}\n")
+    
+    if shard is not None:
+        shard.close()
     if fid.fileno() not in {0, 1, 2}:
         fid.close()
         
@@ -108,6 +108,12 @@ class G2p(object):
         self.fc_w = self.variables["fc_w"]  # (74, 128)
         self.fc_b = self.variables["fc_b"]  # (74,)
 
+    def __getstate__(self):
+        # the npz file can not be pickled, the arrays loaded from it are enough
+        state = self.__dict__.copy()
+        state.pop("variables", None)
+        return state
+
     def sigmoid(self, x):
         return 1 / (1 + np.exp(-x))
 
@@ -166,6 +172,48 @@ class G2p(object):
         preds = [self.idx2p.get(idx, "<unk>") for idx in preds]
         return preds
 
+    def predict_batch(self, words, batch_size=64):
+        # same as `predict` of each word, words of similar length are padded into one batch
+        outputs = [None for _ in words]
+        order = sorted(range(len(words)), key=lambda i: len(words[i]))
+        for start in range(0, len(order), batch_size):
+            index = order[start:start+batch_size]
+            for i, preds in zip(index, self._predict_batch([words[i] for i in index])):
+                outputs[i] = preds
+        return outputs
+
+    def _predict_batch(self, words):
+        B = len(words)
+        lens = np.array([len(word) for word in words])
+
+        # encoder, the padded steps after `</s>` do not change the hidden state of each word before them
+        x = np.zeros((B, lens.max() + 1), dtype=np.int64) # 0: <pad>
+        for b, word in enumerate(words):
+            x[b, :len(word)+1] = [self.g2idx.get(char, self.g2idx["<unk>"]) for char in list(word) + ["</s>"]]
+        enc = np.take(self.enc_emb, x, axis=0)
+        enc = self.gru(enc, x.shape[1], self.enc_w_ih, self.enc_w_hh,
+                       self.enc_b_ih, self.enc_b_hh, h0=np.zeros((B, self.enc_w_hh.shape[-1]), np.float32))
+        last_hidden = enc[np.arange(B), lens, :]
+
+        # decoder, the finished words are dropped from batch
+        dec = np.take(self.dec_emb, np.full(B, 2), axis=0)  # 2: <s>
+        h = last_hidden
+        active = np.arange(B)
+
+        preds = [[] for _ in range(B)]
+        for i in range(20):
+            h = self.grucell(dec, h, self.dec_w_ih, self.dec_w_hh, self.dec_b_ih, self.dec_b_hh)  # (b, h)
+            logits = np.matmul(h, self.fc_w.T) + self.fc_b
+            pred = logits.argmax(-1)
+            alive = pred != 3  # 3: </s>
+            active, h, pred = active[alive], h[alive], pred[alive]
+            if len(active) == 0: break
+            for b, p in zip(active, pred):
+                preds[b].append(p)
+            dec = np.take(self.dec_emb, pred, axis=0)
+
+        return [[self.idx2p.get(idx, "<unk>") for idx in pred] for pred in preds]
+
     def __call__(self, word):
         word = word.lower()
         word = re.sub(r'[^a-z]', '', word)
@@ -176,6 +224,15 @@ class G2p(object):
         syls = CMUSylBnd.split_syl(prons)
         return syls
 
+    def batch(self, words):
+        # same as `__call__` of each word
+        words = [re.sub(r'[^a-z]', '', word.lower()) for word in words]
+        outputs = [None for _ in words]
+        index = [i for i, word in enumerate(words) if word != '']
+        for i, prons in zip(index, self.predict_batch([words[i] for i in index])):
+            outputs[i] = CMUSylBnd.split_syl(prons)
+        return outputs
+
 if __name__ == '__main__':
     texts = [
         "I have $250 in my pocket.", # number -> spell-out
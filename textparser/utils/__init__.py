@@ -7,3 +7,8 @@ from .syllable import *
 from .phoneme import *
 from .tone import *
 from .segtext import *
+from .datrie import *
+from .lexicon import *
+from .cache import *
+from .jit import *
+from .shard import *
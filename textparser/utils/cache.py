@@ -0,0 +1,129 @@
+# coding: utf-8
+
+import os
+import json
+import time
+import sqlite3
+from collections import OrderedDict
+
+
+class SqliteStore(object):
+    # persistent key-value store in a sqlite file, which survives restarts and is shared by processes.
+    # keys are str, values are anything json can dump.
+    def __init__(self, path, table="cache"):
+        self.path = path
+        self.table = table
+        self._conn, self._pid = None, None
+
+    def _connect(self):
+        # one connection per process, a forked child must not reuse the connection of parent
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conn"], state["_pid"] = None, None
+        return state
+
+    def __len__(self):
+        return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def get(self, key, default=None):
+        row = self._connect().execute(f"SELECT value FROM {self.table} WHERE key=?", (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def put(self, key, value):
+        self._connect().execute(f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def clear(self):
+        self._connect().execute(f"DELETE FROM {self.table}")
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn, self._pid = None, None
+
+
+class LRUCache(object):
+    # bounded memo with least recently used eviction, and an optional persistent `store` behind it.
+    # maxsize <= 0 means no memo in memory.
+    # codec: optional (encode, decode) of values that the store can not save as they are.
+    # ttl: optional seconds that an entry lives since it is put, in memory and in the store.
+    _missing = object()
+
+    def __init__(self, maxsize=1024, store=None, codec=None, ttl=None):
+        self.maxsize = maxsize
+        self.store = store
+        self.codec = codec
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.expires = dict() # key -> expire time, only if `ttl` is set
+        self.hits, self.store_hits, self.misses = 0, 0, 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        value = self.data.get(key, self._missing)
+        if value is not self._missing and self.ttl is not None and self.expires[key] <= time.time():
+            del self.data[key], self.expires[key]
+            value = self._missing
+        if value is not self._missing:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return value
+        if self.store is not None:
+            value = self.store.get(key, self._missing)
+            if value is not self._missing and self.ttl is not None:
+                # the store keeps [expire, value] if `ttl` is set
+                expire, value = value
+                if expire <= time.time(): value = self._missing
+            else:
+                expire = None
+            if value is not self._missing:
+                self.store_hits += 1
+                if self.codec is not None: value = self.codec[1](value)
+                self._put(key, value, expire)
+                return value
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        expire = None if self.ttl is None else time.time() + self.ttl
+        self._put(key, value, expire)
+        if self.store is not None:
+            if self.codec is not None: value = self.codec[0](value)
+            self.store.put(key, value if expire is None else [expire, value])
+
+    def _put(self, key, value, expire=None):
+        if self.maxsize <= 0: return
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if self.ttl is not None: self.expires[key] = expire
+        while len(self.data) > self.maxsize:
+            key, _ = self.data.popitem(last=False)
+            if self.ttl is not None: del self.expires[key]
+
+    def clear(self):
+        self.data.clear()
+        self.expires.clear()
+        self.hits, self.store_hits, self.misses = 0, 0, 0
+
+    def stats(self):
+        total = self.hits + self.store_hits + self.misses
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.store_hits) / total if total > 0 else 0.,
+        }
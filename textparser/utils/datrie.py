@@ -0,0 +1,149 @@
+# coding: utf-8
+
+from array import array
+
+
+class DATrie(object):
+    # double-array trie, maps str key to any value.
+    # node `t` is the child of node `s` by code `c` iff t == base[s] + c and check[t] == s,
+    # the root is node 0, and value[t] >= 0 is the index of value of the key ending at `t`.
+    def __init__(self, items=None):
+        self.codes = dict() # char -> code, start from 1
+        self.base = array('i', [0])
+        self.check = array('i', [-1])
+        self.value = array('i', [-1])
+        self.values = []
+        if items is not None:
+            self.build(items)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __getitem__(self, key):
+        t = self._find(key)
+        if t < 0: raise KeyError(key)
+        return self.values[self.value[t]]
+
+    def get(self, key, default=None):
+        t = self._find(key)
+        return default if t < 0 else self.values[self.value[t]]
+
+    def _find(self, key):
+        codes, base, check, value = self.codes, self.base, self.check, self.value
+        size = len(check)
+        s = 0
+        for ch in key:
+            c = codes.get(ch)
+            if c is None: return -1
+            t = base[s] + c
+            if t >= size or check[t] != s: return -1
+            s = t
+        return s if value[s] >= 0 else -1
+
+    def prefixes(self, text, start=0, maxlen=None):
+        # all keys which are prefix of text[start:], return [(end, value), ...] sorted by `end`.
+        # the walk stops as soon as no key can match any more.
+        codes, base, check, value, values = self.codes, self.base, self.check, self.value, self.values
+        size = len(check)
+        end = len(text) if maxlen is None else start + maxlen
+        result = []
+        s, i = 0, start
+        for ch in text[start:end]:
+            t = base[s] + codes.get(ch, size)
+            if t >= size or check[t] != s: break
+            s, i = t, i + 1
+            if value[s] >= 0:
+                result.append((i, values[value[s]]))
+        return result
+
+    def build(self, items):
+        # items: dict or iterable of (key, value), empty keys are ignored
+        if hasattr(items, "items"): items = items.items()
+        items = sorted((k, v) for k, v in items if len(k) > 0)
+
+        # frequent chars get small codes, which makes the arrays dense
+        freq = dict()
+        for key, _ in items:
+            for ch in key:
+                freq[ch] = freq.get(ch, 0) + 1
+        self.codes = {ch: i+1 for i, ch in enumerate(sorted(freq, key=lambda ch: (-freq[ch], ch)))}
+        codes = self.codes
+
+        base, check, value = [0], [-1], [-1]
+        self.values = [v for _, v in items]
+
+        # nfree[p] points to a slot not after the first free slot >= p, which is found with path compression
+        nfree = [0]
+
+        def _extend(size):
+            n = size - len(check)
+            if n > 0:
+                nfree.extend(range(len(check), size))
+                base.extend([0] * n)
+                check.extend([-1] * n)
+                value.extend([-1] * n)
+
+        def _next_free(p):
+            _extend(p + 1)
+            q = p
+            while nfree[q] != q:
+                q = nfree[q]
+                _extend(q + 1)
+            while nfree[p] != q:
+                nfree[p], p = q, nfree[p]
+            return q
+
+        # each task is (node, lo, hi, depth): keys in items[lo:hi] share the prefix of length `depth`
+        multi_start = 1
+        stack = [(0, 0, len(items), 0)]
+        while stack:
+            s, lo, hi, depth = stack.pop()
+            # the key ending here is sorted first
+            if lo < hi and len(items[lo][0]) == depth:
+                value[s] = lo
+                lo += 1
+            if lo >= hi:
+                continue
+
+            # group children by code
+            children = [] # [(code, lo, hi), ...]
+            for k in range(lo, hi):
+                c = codes[items[k][0][depth]]
+                if len(children) > 0 and children[-1][0] == c:
+                    children[-1][2] = k + 1
+                else:
+                    children.append([c, k, k+1])
+
+            # find the first base that all children slots are free
+            c0 = min(c for c, _, _ in children)
+            c1 = max(c for c, _, _ in children)
+            if len(children) == 1:
+                # a single child fits in any free slot
+                p = _next_free(c0 + 1)
+                b = p - c0
+            else:
+                # skip the crowded head for nodes with several children, the holes left there
+                # are filled by single child nodes later
+                p, ntry = _next_free(max(c0 + 1, multi_start)), 0
+                while True:
+                    b = p - c0
+                    _extend(b + c1 + 1)
+                    if all(check[b+c] < 0 for c, _, _ in children):
+                        break
+                    p, ntry = _next_free(p + 1), ntry + 1
+                if ntry > 32: multi_start = p
+
+            base[s] = b
+            for c, _, _ in children:
+                check[b+c] = s
+                nfree[b+c] = b + c + 1
+            for c, clo, chi in children:
+                stack.append((b+c, clo, chi, depth+1))
+
+        self.base = array('i', base)
+        self.check = array('i', check)
+        self.value = array('i', value)
+        return self
@@ -0,0 +1,19 @@
+# coding: utf-8
+
+from textparser.config import Config
+
+# numba is optional, the callers fall back to their python code without it
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def jit(func):
+    # compile `func` in nopython mode at the first call, return None if numba is unavailable
+    if numba is None: return None
+    return numba.njit(cache=True, nogil=True)(func)
+
+def use_jit(kernel):
+    # select the kernel at runtime, `Config.use_numba` turns it off
+    return kernel is not None and Config.use_numba
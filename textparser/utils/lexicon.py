@@ -0,0 +1,231 @@
+# coding: utf-8
+
+import os, sys
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+
+from .datrie import DATrie
+
+
+LEXICON_MAGIC = b"TPLEXICN"
+LEXICON_VERSION = 1
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def file_stamp(path, sha1=True):
+    st = os.stat(path)
+    stamp = {"mtime": int(st.st_mtime), "size": st.st_size}
+    if sha1: stamp["sha1"] = file_sha1(path)
+    return stamp
+
+def check_stamp(path, stamp):
+    # compare hash only if mtime or size is changed
+    if not os.path.exists(path): return False
+    st = os.stat(path)
+    if int(st.st_mtime) == stamp["mtime"] and st.st_size == stamp["size"]:
+        return True
+    return file_sha1(path) == stamp["sha1"]
+
+
+class _LexiconValues(object):
+    # decode the payload of k-th word from packed arrays, only when it is hit
+    def __init__(self, kind, arrays, syllables, tags):
+        self.kind = kind
+        self.syllables = syllables
+        self.tags = tags
+        self.null = arrays["null"] # bit0: pinyin is None, bit1: flag is None
+        self.weight = arrays.get("weight")
+        self.py_off, self.py_ids = arrays["py_off"], arrays["py_ids"]
+        self.pos_off, self.pos_ids, self.pos_wts = arrays["pos_off"], arrays["pos_ids"], arrays["pos_wts"]
+        self.flag_off, self.flag_ids, self.flag_wts = arrays.get("flag_off"), arrays.get("flag_ids"), arrays.get("flag_wts")
+
+    def __len__(self):
+        return len(self.null)
+
+    def __getitem__(self, k):
+        null, syllables, tags = self.null[k], self.syllables, self.tags
+        pinyin = None
+        if not null & 1:
+            pinyin = [syllables[i] for i in self.py_ids[self.py_off[k]:self.py_off[k+1]]]
+        p0, p1 = self.pos_off[k], self.pos_off[k+1]
+        hpos = dict(zip([tags[i] for i in self.pos_ids[p0:p1]], self.pos_wts[p0:p1]))
+        if self.kind == "en":
+            return (pinyin, hpos)
+        hflag = None
+        if not null & 2:
+            p0, p1 = self.flag_off[k], self.flag_off[k+1]
+            hflag = dict(zip([tags[i] for i in self.flag_ids[p0:p1]], self.flag_wts[p0:p1]))
+        return (self.weight[k], None if pinyin is None else tuple(pinyin), hpos, hflag)
+
+
+class Lexicon(DATrie):
+    # read-only lexicon compiled by `save_lexicon`, the file is opened with mmap,
+    # so one copy in page cache is shared by all processes, and nothing is materialized until a word is hit.
+    # the payload is (weight, pinyin, hpos, hflag) for kind `cn`, and (pinyin, hpos) for kind `en`.
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._open()
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:len(LEXICON_MAGIC)] != LEXICON_MAGIC:
+            raise ValueError(f"{self.path} is not a lexicon file")
+        size, = struct.unpack("<I", mm[len(LEXICON_MAGIC):len(LEXICON_MAGIC)+4])
+        offset = len(LEXICON_MAGIC) + 4
+        self.header = header = json.loads(bytes(mm[offset:offset+size]).decode("utf-8"))
+        if header["version"] != LEXICON_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{self.path} is not compatible, version={header['version']}, byteorder={header['byteorder']}")
+
+        self.kind = header["kind"]
+        self.max_word_length = header["max_word_length"]
+        self.sources = header["sources"]
+        self.codes = header["codes"]
+        view = memoryview(mm)
+        arrays = dict()
+        for name, (typecode, start, length) in header["arrays"].items():
+            arrays[name] = view[start:start+length*array(typecode).itemsize].cast(typecode)
+        self.base, self.check, self.value = arrays["base"], arrays["check"], arrays["value"]
+        self.values = _LexiconValues(self.kind, arrays, header["syllables"], header["tags"])
+
+    def __getstate__(self):
+        # the mmap can not be pickled, reopen it by path
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
+
+    def covers(self, path):
+        return os.path.abspath(path) in self.sources
+
+    def is_valid(self):
+        # all source files are unchanged since compiling
+        return all(check_stamp(path, stamp) for path, stamp in self.sources.items())
+
+
+class LexiconDict(object):
+    # dict-like view of a compiled lexicon with an in-memory overlay, e.g. user dictionaries,
+    # the overlay takes precedence like `dict.update`.
+    def __init__(self, lexicon):
+        self.lexicon = lexicon
+        self.overlay = dict()
+        self.overlay_trie = DATrie()
+
+    def __len__(self):
+        return len(self.lexicon) + sum(1 for k in self.overlay if k not in self.lexicon)
+
+    def __contains__(self, key):
+        return key in self.overlay or key in self.lexicon
+
+    def __getitem__(self, key):
+        if key in self.overlay: return self.overlay[key]
+        return self.lexicon[key]
+
+    def get(self, key, default=None):
+        info = self.overlay.get(key)
+        if info is None: info = self.lexicon.get(key, default)
+        return info
+
+    def update(self, items):
+        self.overlay.update(items)
+        self.overlay_trie = DATrie(self.overlay)
+
+    def prefixes(self, text, start=0, maxlen=None):
+        result = self.lexicon.prefixes(text, start, maxlen)
+        if len(self.overlay) == 0:
+            return result
+        extra = self.overlay_trie.prefixes(text, start, maxlen)
+        if len(extra) == 0:
+            return result
+        merged = dict(result)
+        merged.update(extra)
+        return sorted(merged.items(), key=lambda x: x[0])
+
+
+def save_lexicon(path, kind, wordict, sources=(), max_word_length=None):
+    # wordict: {word: (weight, pinyin, hpos, hflag)} for kind `cn`, {word: (pinyin, hpos)} for kind `en`
+    assert kind in ("cn", "en")
+    trie = DATrie(wordict)
+    items = trie.values # ordered by the value index of trie
+
+    syllables, tags = dict(), dict()
+    null = array('B')
+    weight = array('d')
+    py_off, py_ids = array('i', [0]), array('i')
+    pos_off, pos_ids, pos_wts = array('i', [0]), array('i'), array('d')
+    flag_off, flag_ids, flag_wts = array('i', [0]), array('i'), array('d')
+    for info in items:
+        if kind == "cn":
+            w, pinyin, hpos, hflag = info
+            weight.append(w)
+        else:
+            (pinyin, hpos), hflag = info, None
+        null.append((1 if pinyin is None else 0) | (2 if hflag is None else 0))
+        for py in (pinyin or ()):
+            py_ids.append(syllables.setdefault(py, len(syllables)))
+        py_off.append(len(py_ids))
+        for c, w in hpos.items():
+            pos_ids.append(tags.setdefault(c, len(tags)))
+            pos_wts.append(w)
+        pos_off.append(len(pos_ids))
+        for c, w in (hflag or {}).items():
+            flag_ids.append(tags.setdefault(c, len(tags)))
+            flag_wts.append(w)
+        flag_off.append(len(flag_ids))
+
+    arrays = {
+        "base": trie.base, "check": trie.check, "value": trie.value, "null": null,
+        "py_off": py_off, "py_ids": py_ids, "pos_off": pos_off, "pos_ids": pos_ids, "pos_wts": pos_wts,
+    }
+    if kind == "cn":
+        arrays.update({"weight": weight, "flag_off": flag_off, "flag_ids": flag_ids, "flag_wts": flag_wts})
+
+    if max_word_length is None:
+        max_word_length = max([len(word) for word in wordict] + [0])
+    header = {
+        "version": LEXICON_VERSION,
+        "byteorder": sys.byteorder,
+        "kind": kind,
+        "max_word_length": max_word_length,
+        "sources": {os.path.abspath(p): file_stamp(p) for p in sources},
+        "codes": trie.codes,
+        "syllables": list(syllables),
+        "tags": list(tags),
+        "arrays": dict(),
+    }
+
+    # the offsets of arrays depend on the header size, so layout twice
+    def _layout(header_size):
+        offset = len(LEXICON_MAGIC) + 4 + header_size
+        for name, arr in arrays.items():
+            offset = (offset + 7) // 8 * 8 # align to 8 bytes
+            header["arrays"][name] = (arr.typecode, offset, len(arr))
+            offset += len(arr) * arr.itemsize
+        return json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data = _layout(0)
+    while True:
+        data, prev = _layout(len(data)), data
+        if len(data) == len(prev): break
+
+    tmp_path = path + f".{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(LEXICON_MAGIC)
+        f.write(struct.pack("<I", len(data)))
+        f.write(data)
+        for name, arr in arrays.items():
+            _, offset, _ = header["arrays"][name]
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(arr.tobytes())
+    os.replace(tmp_path, path)
+    return path
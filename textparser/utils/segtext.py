@@ -1,6 +1,12 @@
 # coding: utf-8
 
+import sys
+import struct
+import marshal
+from array import array
+
 from .lang import Lang
+from .gpos import GPOS
 
 class SegText(object):
     
@@ -16,10 +22,9 @@ class SegText(object):
         # e.g.: "无力感/wu2-li4-gan3;n;CN;0; 。/sil0;w;CN;0;"
         lines = line.strip().split()
         for s in lines:
-            for i in range(len(s)-1, -1, -1):
-                if s[i] == '/': break
+            i = s.rfind('/')
+            if i <= 0: continue
             wd = s[:i]
-            if wd == '': continue
             py, cx, lang, sentype, mark, _ = s[i+1:].split(';')[:SegText._ncols]
             py = py.split('-')
             if len(py) == 0 or (len(py) == 1 and py[0] == ''):
@@ -33,17 +38,12 @@ class SegText(object):
     
     def printer(self):
         # _data: [['无力感', ['wu2', 'li4', 'gan3'], 'n', 'CN', 0], ['。', ['sil0'], 'w', 'CN', 0]]
-        line = ''
-        for s in self._data:
-            wd = s[0] if s[0] is not None else ''
-            py = '-'.join(s[1]) if s[1] is not None else ''
-            cx = s[2] if s[2] is not None else ''
-            lang = s[3] if s[3] is not None else ''
-            sentype = s[4] if s[4] is not None else ''
-            mark = s[5] if s[5] is not None else ''
-            line += f"{wd}/{py};{cx};{lang};{sentype};{mark}; "
+        items = []
+        for wd, py, cx, lang, sentype, mark in self._data:
+            items.append(f"{wd or ''}/{'' if py is None else '-'.join(py)};{cx or ''};{lang or ''};"
+                         f"{'' if sentype is None else sentype};{mark or ''};")
         # line: "无力感/wu2-li4-gan3;n;CN;0; 。/sil0;w;CN;0;"
-        return line.strip()
+        return ' '.join(items)
     
     def set_wpc(self, idx: int, wd: str, py, cx: str):
         if -len(self._data) <= idx < len(self._data):
@@ -135,6 +135,30 @@ class SegText(object):
         if -len(self._data) <= idx < len(self._data):
             self._data[idx][5] = mark
     
+    # bulk accessors, one list per field
+    def words(self):
+        return [elem[0] for elem in self._data]
+    
+    def pinyins(self):
+        return [self.get_py(i) for i in range(len(self._data))]
+    
+    def gposes(self):
+        return [elem[2] for elem in self._data]
+    
+    def langs(self):
+        return [elem[3] for elem in self._data]
+    
+    def sentypes(self):
+        return [elem[4] for elem in self._data]
+    
+    def set_sentypes(self, sentypes):
+        assert len(sentypes) == len(self._data)
+        for elem, sentype in zip(self._data, sentypes):
+            elem[4] = sentype
+    
+    def marks(self):
+        return [elem[5] for elem in self._data]
+    
     def __str__(self):
         return self.printer()
     
@@ -152,11 +176,12 @@ class SegText(object):
         
     def __add__(self, other):
         tmp = SegText()
-        tmp._data = self._data + other._data
+        tmp._data = list(self._data)
+        tmp.extend(other)
         return tmp
     
     def __iadd__(self, other):
-        self._data += other._data
+        self.extend(other)
         return self
     
     def append(self, elem=None):
@@ -165,7 +190,12 @@ class SegText(object):
         self._data.append(elem)
     
     def extend(self, other):
-        self._data.extend(other._data)
+        if isinstance(other, SegText):
+            self._data.extend(other._data)
+        elif isinstance(other, ColumnSegText):
+            self._data.extend(other.to_segtext()._data)
+        else:
+            raise TypeError(f"can not extend SegText by {type(other).__name__}")
     
     def pop(self, idx=-1):
         self._data.pop(idx)
@@ -187,3 +217,366 @@ class SegText(object):
         return tmp
 
 
+
+
+class ColumnSegText(object):
+    # columnar variant of `SegText` with the same getters and setters:
+    # one parallel column per field instead of one 6-element list per word,
+    # pinyin is kept as it is set (list or tuple) like `SegText`, and list pinyin is copied by `copy`,
+    # gpos/lang are codes of the fixed GPOS/Lang tables, sentype is a short integer.
+    # other gpos/lang tags (e.g. of a custom dictionary) are kept in a small table of each instance.
+    # rows are views which write back to the columns, see `_ColumnRow`.
+    __slots__ = ("_wd", "_py", "_cx", "_lang", "_sentype", "_mark", "_xtags")
+    
+    _ncols = SegText._ncols
+    _nosentype = -32768 # sentype is None
+    
+    # fixed codes of gpos/lang tags shared by all processes, code 0 is None
+    _tags = (None, Lang.UNKNOW, Lang.CN, Lang.EN) + GPOS.gpos_list
+    _tag_codes = {tag: code for code, tag in enumerate(_tags)}
+    
+    def __init__(self, line=None):
+        self._wd, self._py, self._mark = [], [], []
+        self._cx, self._lang, self._sentype = array('H'), array('H'), array('h')
+        self._xtags = []
+        if line is not None:
+            self.parser(line)
+    
+    def _tag(self, tag):
+        # code of tag, the tags out of the fixed table are coded after it by the instance
+        code = self._tag_codes.get(tag)
+        if code is None:
+            xtags = self._xtags
+            if tag in xtags:
+                code = len(self._tags) + xtags.index(tag)
+            else:
+                code = len(self._tags) + len(xtags)
+                if code > 0xffff: raise ValueError(f"too many gpos/lang tags, can not add {tag}")
+                xtags.append(tag)
+        return code
+    
+    def _all_tags(self):
+        # tag of each code
+        return self._tags + tuple(self._xtags) if self._xtags else self._tags
+    
+    @staticmethod
+    def _pinyin(py):
+        if type(py) is str: py = py.split('-')
+        if not ((type(py) is list or type(py) is tuple) and len(py) > 0 and len(py[0]) > 0):
+            return None
+        return py
+    
+    @classmethod
+    def from_segtext(cls, segtext):
+        tmp = cls()
+        for elem in segtext:
+            tmp.append(elem)
+        return tmp
+    
+    def to_segtext(self):
+        tmp = SegText()
+        for wd, py, cx, lang, sentype, mark in zip(self._wd, self._py, self.gposes(), self.langs(), self.sentypes(), self._mark):
+            tmp.append([wd, None if py is None else list(py), cx, lang, sentype, mark])
+        return tmp
+    
+    def __getstate__(self):
+        # pickle the tags by name, the codes of other tags are local to each instance
+        return (self._wd, self._py, self.gposes(), self.langs(), self._sentype, self._mark)
+    
+    def __setstate__(self, state):
+        wd, py, cx, lang, sentype, mark = state
+        self._wd, self._py, self._sentype, self._mark = wd, py, sentype, mark
+        self._xtags = []
+        self._cx = array('H', [self._tag(x) for x in cx])
+        self._lang = array('H', [self._tag(x) for x in lang])
+    
+    def parser(self, line:str):
+        # line: "{word}/{pinyin};{gpos};{lang};{sentype};{mark}; ..."
+        tag_codes, tag = self._tag_codes, self._tag
+        for s in line.strip().split():
+            i = s.rfind('/')
+            if i <= 0: continue
+            py, cx, lang, sentype, mark, _ = s[i+1:].split(';')[:self._ncols]
+            cx, lang = cx or None, lang or None
+            self._wd.append(s[:i])
+            self._py.append(py.split('-') if py != '' and py[0] != '-' else None)
+            self._cx.append(tag_codes.get(cx) or tag(cx))
+            self._lang.append(tag_codes.get(lang) or tag(lang))
+            self._sentype.append(self._nosentype if sentype == '' else int(sentype))
+            self._mark.append(mark or None)
+    
+    def printer(self):
+        tags, nosentype = self._all_tags(), self._nosentype
+        items = []
+        for wd, py, cx, lang, sentype, mark in zip(self._wd, self._py, self._cx, self._lang, self._sentype, self._mark):
+            items.append(f"{wd or ''}/{'' if py is None else '-'.join(py)};{tags[cx] or ''};{tags[lang] or ''};"
+                         f"{'' if sentype == nosentype else sentype};{mark or ''};")
+        return ' '.join(items)
+    
+    def dumps(self):
+        # binary of the columns by marshal, which loads several times faster than parsing the text,
+        # sentype is little-endian int16 like the other binary fields
+        sentype = self._sentype
+        if sys.byteorder != 'little':
+            sentype = array('h', sentype)
+            sentype.byteswap()
+        return marshal.dumps((self._wd, self._py, self.gposes(), self.langs(), sentype.tobytes(), self._mark))
+    
+    @classmethod
+    def loads(cls, data):
+        wd, py, cx, lang, sentype, mark = marshal.loads(data)
+        tmp = cls()
+        tmp._wd, tmp._py, tmp._mark = wd, py, mark
+        tmp._cx = array('H', [tmp._tag(x) for x in cx])
+        tmp._lang = array('H', [tmp._tag(x) for x in lang])
+        tmp._sentype.frombytes(sentype)
+        if sys.byteorder != 'little':
+            tmp._sentype.byteswap()
+        return tmp
+    
+    def set_wpc(self, idx: int, wd: str, py, cx: str):
+        if -len(self._wd) <= idx < len(self._wd):
+            self._wd[idx] = wd
+            self._py[idx] = self._pinyin(py)
+            self._cx[idx] = self._tag_codes.get(cx) or self._tag(cx)
+    
+    def get_wpc(self, idx: int, wd=None, py=None, cx=None):
+        if -len(self._wd) <= idx < len(self._wd):
+            if self._wd[idx] is not None: wd = self._wd[idx]
+            if self._py[idx] is not None: py = self._py[idx]
+            if self._cx[idx] > 0: cx = self._all_tags()[self._cx[idx]]
+        return wd, py, cx
+    
+    def get_wd(self, idx: int, wd=None):
+        if -len(self._wd) <= idx < len(self._wd) and self._wd[idx] is not None:
+            wd = self._wd[idx]
+        return wd
+    
+    def set_wd(self, idx: int, wd: str):
+        if -len(self._wd) <= idx < len(self._wd):
+            self._wd[idx] = wd
+    
+    def get_py(self, idx: int, py=None):
+        if -len(self._wd) <= idx < len(self._wd) and self._py[idx] is not None:
+            py = self._py[idx]
+        return py
+    
+    def set_py(self, idx: int, py):
+        if -len(self._wd) <= idx < len(self._wd):
+            self._py[idx] = self._pinyin(py)
+    
+    def get_cx(self, idx: int, cx=None):
+        if -len(self._wd) <= idx < len(self._wd) and self._cx[idx] > 0:
+            cx = self._all_tags()[self._cx[idx]]
+        return cx
+    
+    def set_cx(self, idx: int, cx: str):
+        if -len(self._wd) <= idx < len(self._wd):
+            self._cx[idx] = self._tag_codes.get(cx) or self._tag(cx)
+    
+    def get_lang(self, idx: int, lang=Lang.UNKNOW):
+        if -len(self._wd) <= idx < len(self._wd) and self._lang[idx] > 0:
+            lang = self._all_tags()[self._lang[idx]]
+        return lang
+    
+    def set_lang(self, idx: int, lang: str = Lang.CN):
+        if -len(self._wd) <= idx < len(self._wd):
+            self._lang[idx] = self._tag_codes.get(lang) or self._tag(lang)
+    
+    def get_sentype(self, idx: int, sentype=0):
+        if -len(self._wd) <= idx < len(self._wd) and self._sentype[idx] != self._nosentype:
+            sentype = self._sentype[idx]
+        return sentype
+    
+    def set_sentype(self, idx: int, sentype: int = 0):
+        if -len(self._wd) <= idx < len(self._wd):
+            self._sentype[idx] = self._nosentype if sentype is None else sentype
+    
+    def get_mark(self, idx: int, mark=None):
+        if -len(self._wd) <= idx < len(self._wd) and self._mark[idx] is not None:
+            mark = self._mark[idx]
+        return mark
+    
+    def set_mark(self, idx: int, mark: str):
+        if -len(self._wd) <= idx < len(self._wd):
+            self._mark[idx] = mark
+    
+    # bulk accessors, one list per column
+    def words(self):
+        return list(self._wd)
+    
+    def pinyins(self):
+        return list(self._py)
+    
+    def gposes(self):
+        tags = self._all_tags()
+        return [tags[cx] for cx in self._cx]
+    
+    def langs(self):
+        tags = self._all_tags()
+        return [tags[lang] for lang in self._lang]
+    
+    def sentypes(self):
+        return [None if x == self._nosentype else x for x in self._sentype]
+    
+    def set_sentypes(self, sentypes):
+        assert len(sentypes) == len(self._sentype)
+        self._sentype = array('h', [self._nosentype if x is None else x for x in sentypes])
+    
+    def marks(self):
+        return list(self._mark)
+    
+    def __str__(self):
+        return self.printer()
+    
+    def _row(self, idx):
+        # [wd, py, cx, lang, sentype, mark] of the row
+        tags, sentype = self._all_tags(), self._sentype[idx]
+        return [self._wd[idx], self._py[idx], tags[self._cx[idx]], tags[self._lang[idx]],
+                None if sentype == self._nosentype else sentype, self._mark[idx]]
+    
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self._wd)))]
+        if not -len(self._wd) <= idx < len(self._wd):
+            raise IndexError("ColumnSegText index out of range")
+        return _ColumnRow(self, idx % len(self._wd))
+    
+    def __setitem__(self, idx, val):
+        wd, py, cx, lang, sentype, mark = val
+        self._wd[idx] = wd
+        self._py[idx] = None if py is None else self._pinyin(py)
+        self._cx[idx] = self._tag(cx)
+        self._lang[idx] = self._tag(lang)
+        self._sentype[idx] = self._nosentype if sentype is None else sentype
+        self._mark[idx] = mark
+    
+    def __delitem__(self, idx):
+        self.pop(idx)
+    
+    def __len__(self):
+        return len(self._wd)
+    
+    def __add__(self, other):
+        tmp = self.copy()
+        tmp.extend(other)
+        return tmp
+    
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+    
+    def append(self, elem=None):
+        if elem is not None:
+            return self.insert(len(self._wd), elem)
+        self._wd.append(None)
+        self._py.append(None)
+        self._cx.append(0)
+        self._lang.append(0)
+        self._sentype.append(self._nosentype)
+        self._mark.append(None)
+    
+    def extend(self, other):
+        if type(other) is SegText:
+            for elem in other._data:
+                self.append(elem)
+            return
+        if type(other) is not ColumnSegText:
+            raise TypeError(f"can not extend ColumnSegText by {type(other).__name__}")
+        self._wd.extend(other._wd)
+        self._py.extend(other._py)
+        if other._xtags:
+            # the codes of other tags are local to `other`
+            self._cx.extend(array('H', [self._tag(x) for x in other.gposes()]))
+            self._lang.extend(array('H', [self._tag(x) for x in other.langs()]))
+        else:
+            self._cx.extend(other._cx)
+            self._lang.extend(other._lang)
+        self._sentype.extend(other._sentype)
+        self._mark.extend(other._mark)
+    
+    def pop(self, idx=-1):
+        for col in (self._wd, self._py, self._cx, self._lang, self._sentype, self._mark):
+            col.pop(idx)
+    
+    def clear(self):
+        self._wd, self._py, self._mark = [], [], []
+        self._cx, self._lang, self._sentype = array('H'), array('H'), array('h')
+        self._xtags = []
+    
+    def insert(self, idx, elem=None):
+        if elem is None:
+            elem = [None for _ in range(self._ncols)]
+        wd, py, cx, lang, sentype, mark = elem
+        self._wd.insert(idx, wd)
+        self._py.insert(idx, None if py is None else self._pinyin(py))
+        self._cx.insert(idx, self._tag(cx))
+        self._lang.insert(idx, self._tag(lang))
+        self._sentype.insert(idx, self._nosentype if sentype is None else sentype)
+        self._mark.insert(idx, mark)
+    
+    def copy(self, start=0, end=None):
+        # columns are sliced, list pinyin is copied and tuple pinyin is shared
+        tmp = ColumnSegText()
+        if end is None: end = len(self._wd)
+        tmp._wd, tmp._mark = self._wd[start:end], self._mark[start:end]
+        tmp._py = [list(py) if type(py) is list else py for py in self._py[start:end]]
+        tmp._cx, tmp._lang, tmp._sentype = self._cx[start:end], self._lang[start:end], self._sentype[start:end]
+        tmp._xtags = list(self._xtags)
+        return tmp
+
+
+class _ColumnRow(object):
+    # one row of `ColumnSegText` which works like the 6-element list of `SegText`,
+    # items set to it are written back to the columns; it refers to the row by index,
+    # so it is only valid until rows are inserted or removed before it.
+    __slots__ = ("_segtext", "_idx")
+    
+    def __init__(self, segtext, idx):
+        self._segtext, self._idx = segtext, idx
+    
+    def __len__(self):
+        return ColumnSegText._ncols
+    
+    def __iter__(self):
+        return iter(self._segtext._row(self._idx))
+    
+    def __getitem__(self, k):
+        return self._segtext._row(self._idx)[k]
+    
+    def __setitem__(self, k, val):
+        row = self._segtext._row(self._idx)
+        row[k] = val
+        self._segtext[self._idx] = row
+    
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, _ColumnRow)): return NotImplemented
+        return list(self) == list(other)
+    
+    __hash__ = None
+    
+    def copy(self):
+        return self._segtext._row(self._idx)
+    
+    def __repr__(self):
+        return repr(self._segtext._row(self._idx))
+
+
+def dump_segtext(fid, utt_id, segtext):
+    # write one record of binary wire format to `fid` opened in binary mode:
+    # 4 bytes little-endian length, then marshaled (utt_id, columns)
+    if type(segtext) is not ColumnSegText:
+        segtext = ColumnSegText.from_segtext(segtext)
+    data = marshal.dumps((utt_id, segtext.dumps()))
+    fid.write(struct.pack("<I", len(data)))
+    fid.write(data)
+
+
+def load_segtexts(fid):
+    # read records written by `dump_segtext`, yield (utt_id, segtext)
+    while True:
+        head = fid.read(4)
+        if len(head) < 4: break
+        size, = struct.unpack("<I", head)
+        utt_id, data = marshal.loads(fid.read(size))
+        yield utt_id, ColumnSegText.loads(data)
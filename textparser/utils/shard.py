@@ -0,0 +1,137 @@
+# coding: utf-8
+
+import os
+import glob
+import json
+import numpy as np
+
+
+SHARD_VERSION = 1
+
+
+def _shard_paths(outdir, prefix, k):
+    base = os.path.join(outdir, f"{prefix}-{k:05d}")
+    return base + ".data", base + ".index"
+
+
+class ShardWriter(object):
+    # append 2-D arrays of many utterances into a few large shards in `outdir`, instead of one file per utterance.
+    # each shard has two files:
+    #   `{prefix}-{k:05d}.data`: rows of all arrays in the shard, concatenated in raw bytes
+    #   `{prefix}-{k:05d}.index`: a json header line, then one line `utt_id<TAB>row offset<TAB>row number` per array
+    # a new shard is opened when the data file exceeds `shard_size` bytes.
+    def __init__(self, outdir, shard_size=1<<30, prefix="shard"):
+        self.outdir = outdir
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.dtype, self.dim = None, None
+        self.shard_id = -1
+        self._data, self._index = None, None
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        # continue after the existing shards
+        while os.path.exists(_shard_paths(outdir, prefix, self.shard_id + 1)[1]):
+            self.shard_id += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self):
+        self.close()
+        self.shard_id += 1
+        data_path, index_path = _shard_paths(self.outdir, self.prefix, self.shard_id)
+        self._data = open(data_path, 'wb')
+        self._index = open(index_path, 'wt', encoding="utf-8")
+        header = {"version": SHARD_VERSION, "dtype": self.dtype.str, "dim": self.dim}
+        self._index.write(json.dumps(header) + "\n")
+        self._rows = 0
+
+    def write(self, utt_id, array):
+        # return (data path, row offset, row number)
+        array = np.ascontiguousarray(array)
+        assert array.ndim == 2, f"shape={array.shape}"
+        assert not any(c.isspace() for c in utt_id), f"utt_id=`{utt_id}` has white space"
+        if self.dtype is None:
+            self.dtype, self.dim = array.dtype, array.shape[1]
+        assert array.dtype == self.dtype and array.shape[1] == self.dim, \
+            f"dtype={array.dtype}, shape={array.shape}, but {self.dtype} and {self.dim} are expected"
+
+        if self._data is None or self._data.tell() >= self.shard_size:
+            self._open()
+        offset = self._rows
+        self._data.write(array.tobytes())
+        self._index.write(f"{utt_id}\t{offset}\t{len(array)}\n")
+        self._rows += len(array)
+        return self._data.name, offset, len(array)
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+        self._data, self._index = None, None
+
+
+class ShardReader(object):
+    # random access of arrays written by `ShardWriter`, data files are memory-mapped and arrays are views of them
+    def __init__(self, outdir, prefix="shard"):
+        self.outdir = outdir
+        self.prefix = prefix
+        self.index = dict() # utt_id -> (shard, offset, rows)
+        self.shards = [] # [(data path, dtype, dim), ...]
+        self._mmaps = dict()
+        for index_path in sorted(glob.glob(os.path.join(outdir, f"{prefix}-[0-9]*.index"))):
+            self._load_index(index_path)
+
+    def _load_index(self, index_path):
+        shard = len(self.shards)
+        with open(index_path, 'rt', encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header["version"] != SHARD_VERSION:
+                raise ValueError(f"{index_path} is not compatible, version={header['version']}")
+            self.shards.append((index_path[:-len(".index")] + ".data", np.dtype(header["dtype"]), header["dim"]))
+            for line in f:
+                utt_id, offset, rows = line.rstrip("\n").split("\t")
+                self.index[utt_id] = (shard, int(offset), int(rows))
+
+    def _mmap(self, shard):
+        mm = self._mmaps.get(shard)
+        if mm is None:
+            path, dtype, dim = self.shards[shard]
+            if os.path.getsize(path) == 0:
+                mm = np.zeros((0, dim), dtype=dtype)
+            else:
+                mm = np.memmap(path, dtype=dtype, mode='r').reshape(-1, dim)
+            self._mmaps[shard] = mm
+        return mm
+
+    def __getstate__(self):
+        # the memory maps are reopened in each process
+        state = self.__dict__.copy()
+        state["_mmaps"] = dict()
+        return state
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, utt_id):
+        return utt_id in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, utt_id):
+        shard, offset, rows = self.index[utt_id]
+        return self._mmap(shard)[offset:offset+rows]
+
+    def get(self, utt_id, default=None):
+        return self[utt_id] if utt_id in self.index else default
+
+    def keys(self):
+        return self.index.keys()
+
+    def items(self):
+        for utt_id in self.index:
+            yield utt_id, self[utt_id]
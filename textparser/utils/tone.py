@@ -1,9 +1,12 @@
 # coding: utf-8
 
+import numpy as np
+
 from .lang import Lang
 
 class Tone:
     tone_num = 9 # sil: 0; CN: 1~5; EN: 0~2
+    en_offset = 6 # EN tones are indexed after CN tones
     
     @staticmethod
     def tone2idx(tone, lang):
@@ -14,14 +17,20 @@ class Tone:
             if idx < 0: idx = 0
             if idx > 5: idx = 5
         elif lang == Lang.EN:
-            idx += 6
+            idx += Tone.en_offset
         return idx
     
     @staticmethod
     def idx2tone(idx):
-        if idx > 5: idx -= 6
+        if idx >= Tone.en_offset: idx -= Tone.en_offset
         return idx
     
+    @staticmethod
+    def idx2tones(idx):
+        # `idx2tone` of each item of an integer array
+        idx = np.asarray(idx)
+        return np.where(idx >= Tone.en_offset, idx - Tone.en_offset, idx)
+    
     @staticmethod
     def one_hot(tone, lang):
         hot = [0. for _ in range(Tone.tone_num)]
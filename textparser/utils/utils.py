@@ -38,35 +38,23 @@ def is_quantifier(strs):
         return True
     return False
 
+# translate tables of full-width and half-width characters,
+# the text is returned as is if no character can be translated
+_dbc2sbc_table = {0x3000: 0x0020}
+_dbc2sbc_table.update({c: c - 0xfee0 for c in range(0xff01, 0xff5f)})
+_dbc2sbc_regex = re.compile('[\u3000\uff01-\uff5e]')
+_sbc2dbc_table = {v: k for k, v in _dbc2sbc_table.items()}
+_sbc2dbc_regex = re.compile('[\u0020-\u007e]')
+
 def DBC2SBC(ustring):
     '''全角转半角'''
-    rstring = ""
-    for uchar in ustring:
-        inside_code = ord(uchar)
-        if inside_code == 0x3000:
-            inside_code = 0x0020
-        else:
-            inside_code -= 0xfee0
-            if not(0x0021 <= inside_code <= 0x7e):
-                rstring += uchar
-                continue
-        rstring += chr(inside_code)
-    return rstring
+    if _dbc2sbc_regex.search(ustring) is None: return ustring
+    return ustring.translate(_dbc2sbc_table)
 
 def SBC2DBC(ustring):
     '''半角转全角'''
-    rstring = ""
-    for uchar in ustring:
-        inside_code = ord(uchar)
-        if inside_code == 0x0020:
-            inside_code = 0x3000
-        else:
-            if not(0x0021 <= inside_code <= 0x7e):
-                rstring += uchar
-                continue
-            inside_code += 0xfee0
-        rstring += chr(inside_code)
-    return rstring
+    if _sbc2dbc_regex.search(ustring) is None: return ustring
+    return ustring.translate(_sbc2dbc_table)
 
 def is_punctuation(_char):
     return _char in "，。！？！；：……——"